@@ -0,0 +1,135 @@
+import numpy as np
+
+WIN = 0
+FAIL = 1
+NOTER = 2
+# runs cut off by the approximate search, see PAndOrPlanner.init_search
+UNKNOWN = 3
+
+KINDS = {'win': WIN, 'fail': FAIL, 'noter': NOTER, 'unknown': UNKNOWN}
+
+
+def base(level):
+    """ Offset of the block of a level in Alpha.data """
+    return level * (level - 1) // 2 + 5 * level
+
+
+class Alpha:
+    """ The alpha vectors of the search in a single float array
+
+    Level l has a block of l + 5 entries in self.data, at offset base(l):
+        win[l], fail[l], noter[l], unknown[l], loop[0, l], loop[1, l], ..., loop[l, l]
+    i.e. only the upper triangle of alpha['loop'] is stored, column by
+    column. The offsets do not depend on the number of allocated levels, so
+    the array grows geometrically by appending zeros, and flat indices stay
+    valid across growth (see Trail).
+
+    The search writes data through set(), which notes the loop rows written
+    since the last PAndOrPlanner.calc_lambda, so that it only recomputes
+    those and the rows that depend on them.
+    """
+    __slots__ = ('data', 'levels', 'lambda_cache', 'dirty', 'loop_end')
+
+    # loop_rows[i], loop_cols[i]: k, l if data[i] is loop[k, l], -1 for win/fail/noter/unknown entries
+    loop_rows = np.empty(0, dtype=np.intp)
+    loop_cols = np.empty(0, dtype=np.intp)
+    # kind_index[l, x]: index(x, l)
+    kind_index = np.empty((0, len(KINDS)), dtype=np.intp)
+
+    def __init__(self, levels=1):
+        self.levels = levels
+        self.data = np.zeros(base(levels))
+        # set by PAndOrPlanner.calc_lambda
+        self.lambda_cache = None
+        # loop rows written since lambda_cache was made
+        self.dirty = set()
+        # loop_end[k]: the last level l of a loop[k, l] ever written, or -1:
+        # loop[k, l] is zero for l > loop_end[k]
+        self.loop_end = [-1] * levels
+        self._ensure_loop_rows(levels)
+
+    def set(self, index, value):
+        """ data[index] = value, for a flat index or an integer array of them """
+        self.data[index] = value
+        row = Alpha.loop_rows[index]
+        if isinstance(index, np.ndarray):
+            loop = row >= 0
+            for k, l in zip(row[loop].tolist(), Alpha.loop_cols[index][loop].tolist()):
+                self.dirty.add(k)
+                if l > self.loop_end[k]:
+                    self.loop_end[k] = l
+        elif row >= 0:
+            k, l = int(row), int(Alpha.loop_cols[index])
+            self.dirty.add(k)
+            if l > self.loop_end[k]:
+                self.loop_end[k] = l
+
+    @staticmethod
+    def index(kind, level):
+        return base(level) + kind
+
+    @staticmethod
+    def loop_index(k, level):
+        """ Index of loop[k, level] """
+        return base(level) + 4 + k
+
+    @staticmethod
+    def loop_column(level, start=0, stop=None):
+        """ Slice of loop[start:stop, level] (stop is at most level + 1) """
+        offset = base(level) + 4
+        return slice(offset + start, offset + (level + 1 if stop is None else stop))
+
+    def loop_row(self, k, stop=None):
+        """ Indices of loop[k, l] for the allocated levels k <= l < stop """
+        return base(np.arange(k, self.levels if stop is None else stop)) + 4 + k
+
+    def ensure_levels(self, levels):
+        """ Makes room for at least `levels` levels, doubling the allocation if needed """
+        if self.levels < levels:
+            self.levels = max(levels, 2 * self.levels)
+            data = np.zeros(base(self.levels))
+            data[:len(self.data)] = self.data
+            self.data = data
+            self.loop_end.extend([-1] * (self.levels - len(self.loop_end)))
+            self._ensure_loop_rows(self.levels)
+
+    @classmethod
+    def _ensure_loop_rows(cls, levels):
+        n = len(cls.loop_rows)
+        if n < base(levels):
+            levels = max(levels, 2 * _num_levels(n))
+            rows = np.full(base(levels), -1, dtype=np.intp)
+            cols = np.full(base(levels), -1, dtype=np.intp)
+            for level in range(levels):
+                rows[Alpha.loop_column(level)] = np.arange(level + 1)
+                cols[Alpha.loop_column(level)] = level
+            cls.loop_rows, cls.loop_cols = rows, cols
+            cls.kind_index = base(np.arange(levels))[:, None] + np.arange(len(KINDS))
+
+    def __deepcopy__(self, memo):
+        new = Alpha.__new__(Alpha)
+        new.levels = self.levels
+        new.data = self.data.copy()
+        # never modified once created
+        new.lambda_cache = self.lambda_cache
+        new.dirty = set(self.dirty)
+        new.loop_end = list(self.loop_end)
+        return new
+
+    def __getitem__(self, key):
+        """ Dense copy of alpha[key] as it was stored before, for inspection """
+        if key == 'loop':
+            loop = np.zeros((self.levels, self.levels))
+            for level in range(self.levels):
+                loop[:level + 1, level] = self.data[Alpha.loop_column(level)]
+            return loop
+        else:
+            return [float(self.data[base(level) + KINDS[key]]) for level in range(self.levels)]
+
+
+def _num_levels(size):
+    """ Number of levels whose blocks fit in `size` entries """
+    level = 0
+    while base(level + 1) <= size:
+        level += 1
+    return level
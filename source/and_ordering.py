@@ -0,0 +1,92 @@
+"""
+Orders in which an AND step of the search simulates the successor states
+
+The successors come from PAndOrPlanner.extended_next_states, sorted by
+decreasing probability, or from env.init_states_p. An AND step succeeds or
+fails as soon as its bounds of the LGT cross lpc_desired, so the order
+decides how many successors it simulates before that: the likely ones
+first settle a success sooner, the ones most likely to fail first settle a
+failure sooner.
+
+The order also decides which (q, obs) entries of the controller the search
+defines first, and from which state: an entry first reached from a goal
+state can only be (0, stop) (see PAndOrPlanner.get_mealy_qa_iterator), and
+the states q_next are numbered in the order of use. So the orderings do not
+explore the same controllers, and one may find a controller where another
+finds none: on LoopyTest, bound 3, LGT 0.6, 'likely' finds none, while the
+other orderings find one of LGT 0.66.
+"""
+
+from heuristic import goal_reach_bounds
+
+
+class SuccessorOrdering:
+    """ The default order: most likely first, as extended_next_states sorts them """
+    name = 'likely'
+    # whether reorder() depends on the likelihoods of the AND step so far
+    dynamic = False
+
+    def start(self, planner):
+        """ Called by PAndOrPlanner.init_search before the search """
+        pass
+
+    def order(self, sl_next):
+        """ The (state, p) successors of an AND step, in the order to simulate them """
+        return sl_next
+
+    def reorder(self, sl_next, start, lower, upper, lpc_desired):
+        """ sl_next with the successors sl_next[start:] that are left reordered, for an AND
+        step whose LGT is in [lower, upper] after simulating the first ones """
+        return sl_next
+
+
+class UnlikelyOrdering(SuccessorOrdering):
+    """ Least likely first """
+    name = 'unlikely'
+
+    def order(self, sl_next):
+        return sorted(sl_next, key=lambda sp: sp[1])
+
+
+class FailFirstOrdering(SuccessorOrdering):
+    """ Largest p * (1 - goal_reach_bounds[s]) first: the successors that certainly
+    fail with the highest likelihood, whatever the controller does """
+    name = 'fail-first'
+
+    def __init__(self):
+        self.env = None
+        self.bounds = None
+
+    def start(self, planner):
+        if self.env is not planner.env:
+            self.env = planner.env
+            self.bounds = planner.goal_bounds or goal_reach_bounds(planner.env)
+
+    def order(self, sl_next):
+        bounds = self.bounds
+        # stable: most likely first among the successors of equal failure likelihood
+        return sorted(sl_next, key=lambda sp: -sp[1] * (1. - bounds.get(sp[0], 1.)))
+
+
+class DynamicOrdering(FailFirstOrdering):
+    """ Fail-first while the LGT bounds of the last AND step that went on are closer
+    to failing than to succeeding, most likely first otherwise """
+    name = 'dynamic'
+    dynamic = True
+
+    def start(self, planner):
+        super().start(planner)
+        self.lower, self.upper, self.lpc_desired = 0., 1., planner.lpc_desired
+
+    def order(self, sl_next):
+        if self.upper - self.lpc_desired < self.lpc_desired - self.lower:
+            return FailFirstOrdering.order(self, sl_next)
+        return sorted(sl_next, key=lambda sp: -sp[1])
+
+    def reorder(self, sl_next, start, lower, upper, lpc_desired):
+        self.lower, self.upper, self.lpc_desired = lower, upper, lpc_desired
+        return sl_next[:start] + self.order(sl_next[start:])
+
+
+SUCCESSOR_ORDERINGS = {cls.name: cls for cls in (SuccessorOrdering, UnlikelyOrdering, FailFirstOrdering,
+                                                 DynamicOrdering)}
@@ -0,0 +1,229 @@
+"""
+Benchmark suite of the search over the bundled environments
+
+Runs a matrix of environments, controller bounds (--max-states) and LGT*
+(--lgt-desired), each search in a fresh process, and records its wall time,
+num_steps, the memory of the search and the controller found. The results
+can be saved as a baseline and later runs compared to it: a case is flagged
+if it got slower or bigger beyond a tolerance (a performance regression), or
+if its steps, result or controller changed (a change in the behaviour of the
+search).
+
+    python bench.py --save baseline.json
+    python bench.py --compare baseline.json
+
+The memory of a search is the peak of the memory allocated during the
+search, as traced by tracemalloc in a run of its own (tracing makes the
+search several times slower), so the imports of numpy and scipy, tens of
+MB, do not count. Wall times depend on the machine: the baseline also records
+the time of a fixed workload that does not use the planner (reference()),
+and the times of the baseline are scaled by the ratio of the reference
+times before comparing. This only makes up for the overall speed of the
+machine, a baseline saved on the same machine is the most reliable one.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import environments
+from and_ordering import SUCCESSOR_ORDERINGS
+from pandor import PAndOrPlanner, PandorControllerNotFound
+
+# (env, env args) -> [(max_states, lgt_desired)]
+# WalkAB and WalkThroughFlap are not NoisyEnv, they have no init_states_p and
+# next_states_p that PAndOrPlanner needs, and TreeChop is a stub, so none of
+# them can be searched.
+MATRIX = [
+    (('WalkThroughFlapProb', ()), [(1, 0.9), (2, 0.99)]),
+    (('ProbHallAone', (4,)), [(2, 0.99)]),
+    (('ProbHallAone', (8,)), [(2, 0.99)]),
+    (('ProbHallArect', (2,)), [(2, 0.9)]),
+    (('ProbHallArect', (3,)), [(4, 0.999)]),
+    (('BridgeWalk', (4,)), [(2, 0.95)]),
+    (('BridgeWalk', (6,)), [(2, 0.99)]),
+    (('Climber', ()), [(1, 0.9), (2, 0.99)]),
+    (('LoopyTest', ()), [(1, 0.5), (3, 0.6)]),
+]
+
+
+def cases():
+    for (env_name, env_args), params in MATRIX:
+        for max_states, lgt_desired in params:
+            yield env_name, env_args, max_states, lgt_desired
+
+
+def case_name(env_name, env_args, max_states, lgt_desired):
+    return "{}{} {} {}".format(env_name, list(env_args), max_states, lgt_desired)
+
+
+def run_case(env_name, env_args, max_states, lgt_desired, options, trace_memory=False):
+    """ Runs one search, meant for a fresh process
+
+    :param trace_memory: measure the memory of the search with tracemalloc, which slows it down
+    :returns: dict of the results of the search, with its memory if trace_memory
+    """
+    env = getattr(environments, env_name)(*env_args)
+    planner = PAndOrPlanner(env)
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    # synth_plan prints whether it found a controller
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            cont, _ = planner.synth_plan(max_states, lgt_desired, **options)
+        except PandorControllerNotFound:
+            cont = None
+    seconds = time.perf_counter() - start
+
+    if cont is not None:
+        # renaming the states of the controller does not change the search behaviour
+        controller = sorted("({},{}) -> ({},{})".format(q, env.str_obs(obs), q_next, env.str_action(action))
+                            for (q, obs), (q_next, action) in cont.canonical_form())
+    else:
+        controller = None
+    results = {'seconds': seconds, 'num_steps': planner.num_steps, 'num_candidates': planner.num_candidates,
+               'found': cont is not None, 'controller': controller}
+    if trace_memory:
+        results['search_memory_kb'] = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    return results
+
+
+def reference(repeat=3):
+    """ Best wall time of a fixed workload of dict, tuple and small numpy operations, as in the search
+
+    It does not use the planner, so that it measures the speed of the machine only.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        table = {}
+        for i in range(200000):
+            key = (i % 997, i % 13)
+            table[key] = table.get(key, 0.) + 0.5 * i
+        data = np.zeros(64)
+        for i in range(20000):
+            data[i % 64] += data[7 * i % 64] * 0.5 + data[i % 64:].sum() * 1e-3
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_suite(options, repeat=1, select=None):
+    """ Runs the cases of MATRIX whose name contains select, keeping the fastest of repeat runs
+
+    The memory of each case is taken from one more run, traced. The
+    reference workload runs before each case, so that its best time is not
+    that of a busy moment of the machine.
+
+    :returns: dict of case name -> results, and the best time of the reference workload
+    """
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    reference_seconds = float('inf')
+    for case in cases():
+        name = case_name(*case)
+        if select is not None and select not in name:
+            continue
+        reference_seconds = min(reference_seconds, reference())
+        runs = []
+        for _ in range(repeat):
+            with ProcessPoolExecutor(1, mp_context=context) as executor:
+                runs.append(executor.submit(run_case, *case, options).result())
+        with ProcessPoolExecutor(1, mp_context=context) as executor:
+            traced = executor.submit(run_case, *case, options, True).result()
+        results[name] = min(runs, key=lambda run: run['seconds'])
+        results[name]['search_memory_kb'] = traced['search_memory_kb']
+        print("{:<32} {:>10.3f} s {:>10} steps {:>10} kB  {}".format(
+            name, results[name]['seconds'], results[name]['num_steps'], results[name]['search_memory_kb'],
+            'found' if results[name]['found'] else 'not found'), flush=True)
+    return results, reference_seconds
+
+
+def compare(results, baseline, time_tolerance=0.25, memory_tolerance=0.25, min_seconds=0.05, min_memory_kb=64,
+            time_scale=1.):
+    """ The differences of results from baseline, as (case name, message)
+
+    Wall time and memory are flagged when they exceed the baseline by more
+    than the given fractions, and by more than min_seconds and min_memory_kb
+    too, so that the noise of the small cases is ignored; num_steps, the result and the controller when they
+    differ at all, since the search is deterministic.
+
+    :param time_scale: factor of the wall times of baseline, the ratio of the reference times of results and baseline
+    """
+    issues = []
+    for name, base in baseline.items():
+        if name not in results:
+            continue
+        new = results[name]
+        base_seconds = base['seconds'] * time_scale
+        if new['seconds'] > max(base_seconds * (1 + time_tolerance), base_seconds + min_seconds):
+            issues.append((name, "slower: {:.3f} s, baseline {:.3f} s".format(new['seconds'], base_seconds)))
+        # baselines saved before the memory of the search was traced have none
+        if 'search_memory_kb' in base and new['search_memory_kb'] > max(
+                base['search_memory_kb'] * (1 + memory_tolerance), base['search_memory_kb'] + min_memory_kb):
+            issues.append((name, "more memory: {} kB, baseline {} kB".format(new['search_memory_kb'],
+                                                                            base['search_memory_kb'])))
+        if new['num_steps'] != base['num_steps']:
+            issues.append((name, "num_steps: {}, baseline {}".format(new['num_steps'], base['num_steps'])))
+        if new['found'] != base['found']:
+            issues.append((name, "controller {}, baseline {}".format(
+                'found' if new['found'] else 'not found', 'found' if base['found'] else 'not found')))
+        elif new['controller'] != base['controller']:
+            issues.append((name, "other controller found"))
+    return issues
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('--save', metavar='PATH', help='Save the results as a baseline to PATH')
+    argparser.add_argument('--compare', metavar='PATH', help='Compare the results to the baseline in PATH')
+    argparser.add_argument('--select', metavar='TEXT', help='Only run the cases whose name contains TEXT')
+    argparser.add_argument('--repeat', type=int, default=1, help='Runs of each case, the fastest is kept')
+    argparser.add_argument('--time-tolerance', type=float, default=0.25,
+                           help='Fraction by which the wall time may exceed the baseline')
+    argparser.add_argument('--memory-tolerance', type=float, default=0.25,
+                           help='Fraction by which the memory of a search may exceed the baseline')
+    argparser.add_argument('--engine', choices=['recursive', 'iterative'], default='recursive')
+    argparser.add_argument('--backtracking', choices=['copy', 'trail'], default='copy')
+    argparser.add_argument('--and-ordering', choices=list(SUCCESSOR_ORDERINGS), default='likely')
+    args = argparser.parse_args()
+
+    options = {'engine': args.engine, 'backtracking': args.backtracking}
+    if args.and_ordering != 'likely':
+        options['and_ordering'] = args.and_ordering
+    results, reference_seconds = run_suite(options, args.repeat, args.select)
+    print("Reference workload: {:.3f} s".format(reference_seconds))
+
+    if args.save is not None:
+        with open(args.save, 'w') as f:
+            json.dump({'options': options, 'reference_seconds': reference_seconds, 'results': results}, f, indent=1)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['options'] != options:
+            print("Warning: the baseline was run with other options: {}".format(baseline['options']))
+        if 'reference_seconds' in baseline:
+            time_scale = reference_seconds / baseline['reference_seconds']
+        else:
+            print("Warning: the baseline has no reference time, its wall times are compared as they are")
+            time_scale = 1.
+        issues = compare(results, baseline['results'], args.time_tolerance, args.memory_tolerance,
+                         time_scale=time_scale)
+        for name, message in issues:
+            print("{}: {}".format(name, message))
+        if issues:
+            sys.exit(1)
+        print("No differences from the baseline")
+
+
+if __name__ == '__main__':
+    main()
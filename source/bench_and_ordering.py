@@ -0,0 +1,55 @@
+"""
+Impact of the order of the AND successors on the search: runs the cases of
+bench.MATRIX with each of and_ordering.SUCCESSOR_ORDERINGS and prints the
+num_steps and the best time of each.
+"""
+
+import argparse
+import contextlib
+import io
+import time
+
+from and_ordering import SUCCESSOR_ORDERINGS
+from bench import case_name, cases
+import environments
+from pandor import PAndOrPlanner, PandorControllerNotFound
+
+
+def run(env_name, env_args, max_states, lgt_desired, and_ordering, engine):
+    env = getattr(environments, env_name)(*env_args)
+    planner = PAndOrPlanner(env)
+    start = time.perf_counter()
+    # synth_plan prints whether it found a controller
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            planner.synth_plan(max_states, lgt_desired, engine=engine, and_ordering=and_ordering)
+            found = True
+        except PandorControllerNotFound:
+            found = False
+    return time.perf_counter() - start, planner.num_steps, found
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('--repeat', type=int, default=1, help='Runs of each search, the best is kept')
+    argparser.add_argument('--engine', choices=['recursive', 'iterative'], default='recursive')
+    argparser.add_argument('--select', metavar='TEXT', help='Only run the cases whose name contains TEXT')
+    args = argparser.parse_args()
+
+    print("{:<28}".format('case') + "".join("{:>22}".format(name) for name in SUCCESSOR_ORDERINGS))
+    for case in cases():
+        name = case_name(*case)
+        if args.select is not None and args.select not in name:
+            continue
+        columns = []
+        for and_ordering in SUCCESSOR_ORDERINGS:
+            results = [run(*case, and_ordering, args.engine) for _ in range(args.repeat)]
+            seconds = min(seconds for seconds, _, _ in results)
+            _, num_steps, found = results[0]
+            columns.append("{:>8}{} {:>8.3f} s".format(num_steps, ' ' if found else '*', seconds))
+        print("{:<28}".format(name) + "".join("{:>22}".format(column) for column in columns), flush=True)
+    print("* no controller found")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Approximate search (--approx, --approx-error) against the exact one: runs
+the cases of bench.MATRIX, all of whose environments loop, and CASES, and
+prints the num_steps, the result and the best time of the exact search and
+of each APPROX setting.
+
+A case is flagged when the approximate search fails, misses a controller
+that the exact search finds, or finds one whose win likelihood is below
+lpc_desired - approx_error; the script then exits with status 1.
+"""
+
+import argparse
+import contextlib
+import io
+import sys
+import time
+
+from bench import case_name, cases
+import environments
+from pandor import PAndOrPlanner, PandorControllerNotFound
+
+# (approx, approx_error)
+APPROX = [(0.1, 0.3), (0.1, 0.), (0.01, 0.05), (0.01, 0.)]
+# (env, env args, max_states, lgt_desired), beyond the cases of bench.MATRIX:
+# a corridor of noisy loops, that the runs cross for sure but on paths of low probability
+CASES = [('ProbHallAone', (6,), 2, 0.9)]
+
+
+def run(env_name, env_args, max_states, lgt_desired, approx, approx_error, engine):
+    env = getattr(environments, env_name)(*env_args)
+    planner = PAndOrPlanner(env)
+    start = time.perf_counter()
+    # synth_plan prints whether it found a controller
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            _, likelihoods = planner.synth_plan(max_states, lgt_desired, engine=engine, approx=approx,
+                                                approx_error=approx_error)
+        except PandorControllerNotFound:
+            likelihoods = None
+    return time.perf_counter() - start, planner.num_steps, likelihoods
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('--repeat', type=int, default=1, help='Runs of each search, the best is kept')
+    argparser.add_argument('--engine', choices=['recursive', 'iterative'], default='recursive')
+    argparser.add_argument('--select', metavar='TEXT', help='Only run the cases whose name contains TEXT')
+    args = argparser.parse_args()
+
+    settings = [(0., 0.)] + APPROX
+    print("{:<28}".format('case') + "{:>22}".format('exact')
+          + "".join("{:>22}".format("{} {}".format(approx, approx_error)) for approx, approx_error in APPROX))
+    issues = []
+    for case in [*cases(), *CASES]:
+        name = case_name(*case)
+        if args.select is not None and args.select not in name:
+            continue
+        lgt_desired = case[3]
+        columns = []
+        for approx, approx_error in settings:
+            try:
+                results = [run(*case, approx, approx_error, args.engine) for _ in range(args.repeat)]
+            except Exception as e:
+                issues.append((name, approx, approx_error, "{}: {}".format(type(e).__name__, e)))
+                columns.append("{:>19}".format('error'))
+                continue
+            seconds = min(seconds for seconds, _, _ in results)
+            _, num_steps, likelihoods = results[0]
+            if not approx:
+                exact_found = likelihoods is not None
+            elif likelihoods is None and exact_found:
+                issues.append((name, approx, approx_error, "no controller found, the exact search finds one"))
+            elif likelihoods is not None and likelihoods['win'] < lgt_desired - approx_error:
+                issues.append((name, approx, approx_error, "win {} below {}".format(
+                    likelihoods['win'], lgt_desired - approx_error)))
+            columns.append("{:>8}{} {:>8.3f} s".format(num_steps, ' ' if likelihoods is not None else '*', seconds))
+        print("{:<28}".format(name) + "".join("{:>22}".format(column) for column in columns), flush=True)
+    print("* no controller found")
+
+    for name, approx, approx_error, message in issues:
+        print("{}, approx {}, approx_error {}: {}".format(name, approx, approx_error, message))
+    if issues:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
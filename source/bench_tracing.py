@@ -0,0 +1,74 @@
+"""
+Overhead of tracing the search: runs the same searches with tracing off,
+with the events sent to logging (to a null stream), and with the events
+written to a trace file, and prints the best time of each.
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+import os
+import tempfile
+import time
+
+import environments
+from pandor import PAndOrPlanner, PandorControllerNotFound
+from tracing import SearchTrace
+
+# (env, env args, states bound, lpc_desired)
+CASES = [
+    ('BridgeWalk', (6,), 2, 0.99),
+    ('ProbHallArect', (2,), 2, 0.9),
+    ('ProbHallArect', (3,), 4, 0.999),
+]
+MODES = ('off', 'log', 'trace')
+
+
+def run(case, mode, engine, trace_path):
+    env_name, env_args, states_bound, lpc_desired = case
+    env = getattr(environments, env_name)(*env_args)
+    planner = PAndOrPlanner(env)
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO if mode == 'log' else logging.WARNING)
+    if mode == 'trace':
+        planner.trace = SearchTrace(env, trace_path)
+
+    start = time.perf_counter()
+    # synth_plan prints whether it found a controller
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            planner.synth_plan(states_bound, lpc_desired, engine=engine)
+        except PandorControllerNotFound:
+            pass
+    seconds = time.perf_counter() - start
+
+    if planner.trace is not None:
+        planner.trace.close()
+    logger.setLevel(logging.WARNING)
+    return seconds, planner.num_steps
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('--repeat', type=int, default=3, help='Runs of each search, the best is kept')
+    argparser.add_argument('--engine', choices=['recursive', 'iterative'], default='recursive')
+    args = argparser.parse_args()
+
+    logging.basicConfig(stream=open(os.devnull, 'w'), level=logging.WARNING)
+    trace_path = os.path.join(tempfile.mkdtemp(), 'trace.jsonl')
+
+    print("{:<24} {:>8} {:>10} {:>10} {:>10}".format('case', 'steps', *MODES))
+    for case in CASES:
+        times = {}
+        for mode in MODES:
+            results = [run(case, mode, args.engine, trace_path) for _ in range(args.repeat)]
+            times[mode] = min(seconds for seconds, _ in results)
+            num_steps = results[0][1]
+        print("{:<24} {:>8} {:>10.3f} {:>10.3f} {:>10.3f}".format(
+            "{}{} {} {}".format(case[0], list(case[1]), case[2], case[3]), num_steps, *(times[mode] for mode in MODES)))
+    os.remove(trace_path)
+
+
+if __name__ == '__main__':
+    main()
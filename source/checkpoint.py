@@ -0,0 +1,67 @@
+import os
+import pickle
+from typing import NamedTuple, Any, List, Tuple
+
+# Bumped when the fields of Checkpoint, or the objects it pickles, change
+VERSION = 3
+
+
+class Checkpoint(NamedTuple):
+    """ The state of an iterative search at the entry of a branching OR node
+
+    The search is deterministic, so the branching OR nodes on the stack with
+    their candidates and the position of the one being tried determine the
+    rest of the state: PAndOrPlanner resumes by replaying the search along
+    them. The controller is only kept to check that the replay arrived at
+    the same node.
+    """
+    version: int
+    # the arguments of the search, which must be the same to resume it
+    params: dict
+    # (candidates, position, nogood log mark) of the branching OR nodes on the stack, bottom first
+    frames: List[Tuple[list, int, Any]]
+    transitions: list
+    num_steps: int
+    num_candidates: int
+    # the state learnt by the search so far
+    ordering: Any
+    nogoods: Any
+
+
+def env_fingerprint(env):
+    """ What a checkpoint records of the environment of its search
+
+    The classes of env and of the environments it wraps (in their `env`
+    attribute, as TabularEnv and CachedEnv do), and for the innermost one
+    its attributes of plain types (the constructor arguments of the
+    environments of environments.py), initial belief and goal states.
+    """
+    classes = [type(env).__name__]
+    while getattr(env, 'env', None) is not None:
+        env = env.env
+        classes.append(type(env).__name__)
+    args = {name: value for name, value in sorted(vars(env).items())
+            if isinstance(value, (bool, int, float, str, tuple, type(None)))}
+    try:
+        goal_states = repr(env.goal_states)
+    except NotImplementedError:
+        goal_states = None
+    return {'classes': tuple(classes), 'args': args, 'init_states_p': repr(env.init_states_p),
+            'goal_states': goal_states}
+
+
+def save_checkpoint(path, checkpoint):
+    """ Writes checkpoint to path, replacing the previous one only once it is complete """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    """ :rtype: Checkpoint """
+    with open(path, 'rb') as f:
+        checkpoint = pickle.load(f)
+    if checkpoint.version != VERSION:
+        raise ValueError(f"Checkpoint {path} has version {checkpoint.version}, expected {VERSION}")
+    return checkpoint
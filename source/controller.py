@@ -1,4 +1,5 @@
-from collections import OrderedDict
+# The action that terminates a run of the controller
+A_STOP = "stop"
 
 
 class MealyController:
@@ -8,18 +9,18 @@ class MealyController:
     """
     def __init__(self, bound):
         self.bound = bound
-        self.transitions = OrderedDict()
+        # (q, obs) -> (q_next, action), in the order they were defined
+        self.transitions = {}
+        # uses[q]: number of transitions leading to q
+        self.uses = [0] * bound
+        self._num_states = 1
 
     @property
     def num_states(self):
         """ Counts the number of states already defined
         (returns 1 for the empty controller)
         """
-
-        if len(self.transitions) == 0:
-            return 1
-        else:
-            return max(q for q, _ in self.transitions.values()) + 1
+        return self._num_states
 
     @property
     def init_state(self):
@@ -40,7 +41,63 @@ class MealyController:
 
         assert q_next < self.bound
 
+        old = self.transitions.get(key)
+        if old is not None:
+            self._forget_use(old[0])
         self.transitions[key] = value
+        self.uses[q_next] += 1
+        if q_next >= self._num_states:
+            self._num_states = q_next + 1
+
+    def __delitem__(self, key):
+        q_next, _ = self.transitions.pop(key)
+        self._forget_use(q_next)
+
+    def _forget_use(self, q_next):
+        uses = self.uses
+        uses[q_next] -= 1
+        # the transitions undone by the search are the last ones added, so
+        # the loop rarely goes below the state the last transition created
+        n = self._num_states
+        while n > 1 and uses[n - 1] == 0:
+            n -= 1
+        self._num_states = n
+
+    def __deepcopy__(self, memo):
+        """ The keys and values of the transitions are immutable, so copying the containers suffices """
+        c = MealyController.__new__(MealyController)
+        c.bound = self.bound
+        c.transitions = self.transitions.copy()
+        c.uses = self.uses.copy()
+        c._num_states = self._num_states
+        memo[id(self)] = c
+        return c
+
+    def canonical_form(self):
+        """ The transitions with the states renamed in the order a breadth-first
+        walk from the initial state reaches them, following observations in the
+        order of their repr()
+
+        Controllers whose states are all reachable from the initial state (like
+        those built by the search) are equal up to renaming their states iff
+        their canonical forms are equal.
+        """
+        by_state = {}
+        for (q, obs), value in self.transitions.items():
+            by_state.setdefault(q, []).append((repr(obs), obs, value))
+
+        names = {self.init_state: 0}
+        order = [self.init_state]
+        for q in order:
+            for _, obs, (q_next, _) in sorted(by_state.get(q, ()), key=lambda item: item[0]):
+                if q_next not in names:
+                    names[q_next] = len(names)
+                    order.append(q_next)
+        for q in sorted(by_state):
+            names.setdefault(q, len(names))
+
+        return frozenset(((names[q], obs), (names[q_next], act))
+                         for (q, obs), (q_next, act) in self.transitions.items())
 
     def __str__(self):
         n = self.num_states
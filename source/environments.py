@@ -79,6 +79,14 @@ class NoisyEnv(Environment):
     def next_states(self, state, action):
         return [s_next for s_next, _ in self.next_states_p(state, action)]
 
+    def next_states_p_sorted(self, state, action):
+        """
+        Same as next_states_p(), sorted by decreasing probability (stable for ties)
+
+        :rtype: list(state, probability)
+        """
+        return sorted(self.next_states_p(state, action), key=lambda sp: sp[1], reverse=True)
+
 
 class WalkAB(Environment):
     """ Environment of Fig. 1 of BPG2009 (Hall-A one-dim)
@@ -0,0 +1,172 @@
+"""
+Exact likelihoods of a finished controller in an environment
+
+A run of a MealyController in a NoisyEnv is a Markov chain on the pairs
+(q, s). A run ends in 'win' if the controller stops in a goal state, and
+in 'fail' if it stops elsewhere, does an illegal action, or has no
+transition for (q, obs); runs that never end are counted as 'noter'.
+"""
+
+import numpy as np
+
+try:
+    import scipy.sparse
+    import scipy.sparse.csgraph
+    import scipy.sparse.linalg
+except ImportError:
+    scipy = None
+
+from controller import A_STOP
+from tabular import TabularEnv, compile_env
+
+# Action codes of controller_tables besides the action ids
+ACT_UNDEFINED = -1
+ACT_STOP = -2
+
+
+def controller_tables(c, env):
+    """ The transitions of c as arrays indexed by (q, observation id)
+
+    :type env: TabularEnv
+    :returns: next_q and act, both of shape (c.num_states, env.num_obs);
+        act holds action ids, ACT_STOP or ACT_UNDEFINED (next_q is 0 then)
+    """
+    obs_ids = {o: i for i, o in enumerate(env.observations)}
+    action_ids = {a: i for i, a in enumerate(env.actions)}
+
+    next_q = np.zeros((c.num_states, env.num_obs), dtype=np.intp)
+    act = np.full((c.num_states, env.num_obs), ACT_UNDEFINED, dtype=np.intp)
+    for (q, obs), (q_next, action) in c.transitions.items():
+        if obs not in obs_ids:
+            # not observable in the reachable states
+            continue
+        o = obs_ids[obs]
+        next_q[q, o] = q_next
+        if action is A_STOP:
+            act[q, o] = ACT_STOP
+        elif action in action_ids:
+            act[q, o] = action_ids[action]
+        else:
+            # never legal in the reachable states: the run fails
+            act[q, o] = env.num_actions
+
+    return next_q, act
+
+
+def product_chain(c, env):
+    """ The Markov chain of c running in env, on the states q * env.num_states + s
+
+    :type env: TabularEnv
+    :returns: (src, dst, p) arrays of the transitions between running
+        states, the boolean arrays win and fail of the states where the run
+        ends, and the initial distribution as (states, p) arrays
+    """
+    n_s, n_a = env.num_states, env.num_actions
+    next_q, act = controller_tables(c, env)
+
+    # per product state
+    a = act[:, env.obs].ravel()
+    q_next = next_q[:, env.obs].ravel()
+    s = np.tile(np.arange(n_s), c.num_states)
+    goal = env.goal[s]
+
+    legal_act = np.zeros(len(a), dtype=bool)
+    moving = (0 <= a) & (a < n_a)
+    legal_act[moving] = env.legal[s[moving], a[moving]]
+
+    win = (a == ACT_STOP) & goal
+    fail = ~legal_act & ~win
+
+    # expand the CSR rows of the moving states
+    src = np.flatnonzero(legal_act)
+    rows = s[src] * n_a + a[src]
+    starts = env.trans_ptr[rows]
+    counts = env.trans_ptr[rows + 1] - starts
+    entry = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    src = np.repeat(src, counts)
+    dst = q_next[src] * n_s + env.trans_state[entry]
+    p = env.trans_p[entry]
+
+    init = np.array([s_0 for s_0, _ in env.init_states_p], dtype=np.intp)
+    init_p = np.array([p_0 for _, p_0 in env.init_states_p])
+
+    return (src, dst, p), win, fail, (init, init_p)
+
+
+def evaluate_controller(c, env):
+    """ The exact likelihoods of c in env
+
+    :param env: a NoisyEnv; it is compiled with compile_env() unless it is a TabularEnv
+    :returns: dict with keys 'win', 'fail', 'noter', like PAndOrPlanner.calc_lambda
+    """
+    if not isinstance(env, TabularEnv):
+        env = compile_env(env)
+
+    (src, dst, p), win, fail, (init, init_p) = product_chain(c, env)
+    x = absorption_likelihoods(src, dst, p, win, fail)
+
+    likelihoods = {key: float(init_p @ x[init, k]) for k, key in enumerate(('win', 'fail'))}
+    likelihoods['noter'] = max(0., 1. - likelihoods['win'] - likelihoods['fail'])
+
+    return likelihoods
+
+
+def absorption_likelihoods(src, dst, p, win, fail):
+    """ The likelihoods of ending in a win and a fail state from each state of a Markov chain
+
+    Solves the absorbing-chain equations x = r + Q x restricted to the
+    states that can end the run, with scipy.sparse if it is installed and
+    dense numpy otherwise.
+
+    :param src, dst, p: arrays of the transitions between running states
+    :param win, fail: boolean arrays of the states where the run ends
+    :returns: array of shape (len(win), 2) of the 'win' and 'fail' likelihoods
+    """
+    n = len(win)
+    ending = can_reach(n, src, dst, win | fail)
+    idx = np.flatnonzero(ending)
+    local = np.full(n, -1, dtype=np.intp)
+    local[idx] = np.arange(len(idx))
+
+    # transitions within the states that can end the run; the rest never end
+    keep = ending[src] & ending[dst]
+    i, j, p = local[src[keep]], local[dst[keep]], p[keep]
+    rhs = np.stack([win[idx], fail[idx]], axis=1).astype(float)
+
+    if len(idx) == 0:
+        x = rhs
+    elif scipy is not None:
+        q_matrix = scipy.sparse.csc_matrix((p, (i, j)), shape=(len(idx), len(idx)))
+        x = scipy.sparse.linalg.spsolve(scipy.sparse.identity(len(idx), format='csc') - q_matrix, rhs)
+        x = np.asarray(x).reshape(len(idx), 2)
+    else:
+        q_matrix = np.zeros((len(idx), len(idx)))
+        np.add.at(q_matrix, (i, j), p)
+        x = np.linalg.solve(np.identity(len(idx)) - q_matrix, rhs)
+
+    likelihoods = np.zeros((n, 2))
+    likelihoods[idx] = x
+    return likelihoods
+
+
+def can_reach(n, src, dst, targets):
+    """ Boolean array of the states with a path to some target state """
+    if scipy is not None:
+        # search the reversed graph from a virtual node n linked to the targets
+        t = np.flatnonzero(targets)
+        graph = scipy.sparse.csr_matrix((np.ones(len(src) + len(t)),
+                                         (np.concatenate([dst, np.full(len(t), n)]),
+                                          np.concatenate([src, t]))),
+                                        shape=(n + 1, n + 1))
+        order = scipy.sparse.csgraph.breadth_first_order(graph, n, return_predecessors=False)
+        reach = np.zeros(n + 1, dtype=bool)
+        reach[order] = True
+        return reach[:n]
+
+    reach = targets.copy()
+    while True:
+        new = reach.copy()
+        new[src[reach[dst]]] = True
+        if (new == reach).all():
+            return reach
+        reach = new
@@ -0,0 +1,45 @@
+"""
+Upper bounds on the goal termination likelihood of the environment states
+
+A controller only sees observations, so from a state s it cannot reach the
+goal with a higher probability than the best policy of the fully
+observable MDP. That maximum is approximated from above by value iteration
+started at 1, which gives an admissible bound at every iteration.
+"""
+
+import numpy as np
+
+from evaluate import can_reach
+from tabular import TabularEnv, compile_env
+
+
+def goal_reach_bounds(env, max_iterations=10000, tolerance=1e-12, epsilon=1e-9):
+    """ Upper bounds of the goal termination likelihood from each reachable state of env
+
+    :param env: a NoisyEnv; it is compiled with compile_env() unless it is a TabularEnv
+    :param tolerance: value iteration stops when no bound changes more than this
+    :param epsilon: added to the bounds, so that rounding errors never
+        make them smaller than the true likelihoods
+    :returns: dict from the states of env to their bounds
+    """
+    tab = env if isinstance(env, TabularEnv) else compile_env(env)
+    n_s, n_a = tab.num_states, tab.num_actions
+
+    row = np.repeat(np.arange(n_s * n_a), np.diff(tab.trans_ptr))
+    src, dst = row // n_a, tab.trans_state
+    # states that reach no goal state have bound 0 (iterations started at 1 may not get there)
+    hopeful = can_reach(n_s, src, dst, tab.goal)
+
+    value = hopeful.astype(float)
+    for _ in range(max_iterations):
+        q_values = np.bincount(row, weights=tab.trans_p * value[dst], minlength=n_s * n_a)
+        new_value = np.maximum(tab.goal, q_values.reshape(n_s, n_a).max(axis=1, initial=0.))
+        new_value[~hopeful] = 0.
+        converged = np.abs(new_value - value).max(initial=0.) <= tolerance
+        value = new_value
+        if converged:
+            break
+
+    bounds = np.where(hopeful, np.minimum(value + epsilon, 1.), 0.)
+    states = range(n_s) if tab is env else tab.states
+    return dict(zip(states, bounds.tolist()))
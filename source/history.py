@@ -0,0 +1,166 @@
+from itertools import chain as chain_iterables
+from typing import NamedTuple, Any
+
+
+class HistoryItem(NamedTuple):
+    q: int
+    s: Any
+    p: float
+
+    def __str__(self):
+        return f"(q: {self.q}, s: {self.s}, p: {self.p:0.1f})"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class _HistoryChain:
+    """ Storage shared by a chain of histories, each extending the previous one
+
+    A chain holds the items of the levels base, base + 1, ...; the levels
+    below base are those of the history `parent` it was forked from.
+    """
+    __slots__ = ('parent', 'base', 'items', 'levels', 'cum_p', 'last_noisy', 'memo')
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.base = len(parent) if parent is not None else 0
+        self.items = []
+        # (q, s) -> level of the items of this chain
+        self.levels = {}
+        # cum_p[i]: product of the p of the levels 0..base + i
+        self.cum_p = []
+        # last_noisy[i]: last level <= base + i with p != 1, or -1
+        self.last_noisy = []
+        # (q, s) -> its level in parent, or None: the lookups below base made so far
+        self.memo = {}
+
+    def append(self, item):
+        n = self.base + len(self.items)
+        self.items.append(item)
+        self.levels[item.q, item.s] = n
+        if len(self.items) > 1:
+            cum_p, last_noisy = self.cum_p[-1], self.last_noisy[-1]
+        elif self.parent is not None and n:
+            cum_p, last_noisy = self.parent.cum_p(-1), self.parent.last_noisy()
+        else:
+            cum_p, last_noisy = 1., -1
+        self.cum_p.append(item.p * cum_p)
+        self.last_noisy.append(n if item.p != 1. else last_noisy)
+
+
+class History:
+    """ History of (q, s, p) items along a branch of the search tree
+
+    A History is never modified: extended() returns a new one. Histories
+    extended from one another share their storage, and a history of length
+    n only looks at the first n items. Extending a history that was already
+    extended (i.e. a sibling branch) starts a new chain that points to it,
+    so that extending costs O(1) either way. Looking up (q, s) in the levels
+    of the older chains walks up the chains, and each chain memoizes the
+    answers: the levels below its fork point never change.
+
+    This relies on each (q, s) occurring at most once in a history, as the
+    search does not extend the history when it finds a loop.
+    """
+    __slots__ = ('_chain', '_len')
+
+    def __init__(self):
+        self._chain = _HistoryChain()
+        self._len = 0
+
+    def extended(self, q, s, p):
+        chain, n = self._chain, self._len
+        assert self.level(q, s) is None, f"({q}, {s}) is already in the history"
+
+        if chain.base + len(chain.items) != n:
+            chain = _HistoryChain(self)
+        chain.append(HistoryItem(q, s, p))
+
+        new = History.__new__(History)
+        new._chain = chain
+        new._len = n + 1
+        return new
+
+    def level(self, q, s):
+        """ The level of (q, s) in the history, or None if it does not occur """
+        chain, key = self._chain, (q, s)
+        k = chain.levels.get(key)
+        if k is not None:
+            # a level beyond the history is on another branch, and (q, s) occurs once on it
+            return k if k < self._len else None
+        if chain.parent is None:
+            return None
+        k = chain.memo.get(key, chain)
+        if k is not chain:
+            return k
+
+        # walk up the chains, until one has (q, s) or has memoized it
+        missed = [chain]
+        history = chain.parent
+        while True:
+            chain = history._chain
+            k = chain.levels.get(key)
+            if k is not None:
+                k = k if k < history._len else None
+                break
+            if chain.parent is None:
+                break
+            k = chain.memo.get(key, chain)
+            if k is not chain:
+                break
+            missed.append(chain)
+            history = chain.parent
+        for chain in missed:
+            chain.memo[key] = k
+        return k
+
+    def _locate(self, k):
+        """ The chain holding level k of the history, and the position of k in it """
+        if k < 0:
+            k += self._len
+        if not 0 <= k < self._len:
+            raise IndexError("history index out of range")
+        chain = self._chain
+        while k < chain.base:
+            chain = chain.parent._chain
+        return chain, k - chain.base
+
+    def cum_p(self, k):
+        """ Product of the p of the items on levels 0..k """
+        chain, i = self._locate(k)
+        return chain.cum_p[i]
+
+    def last_noisy(self):
+        """ The last level with p != 1, or -1 """
+        if self._len == 0:
+            return -1
+        return self._chain.last_noisy[self._len - 1 - self._chain.base]
+
+    def deterministic_after(self, k):
+        """ True if every item on the levels after k has p == 1 """
+        return self.last_noisy() <= k
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return list(self)[k]
+        chain, i = self._locate(k)
+        return chain.items[i]
+
+    def __iter__(self):
+        parts = []
+        history = self
+        while history is not None:
+            chain = history._chain
+            parts.append(chain.items[:history._len - chain.base])
+            history = chain.parent
+        return chain_iterables.from_iterable(reversed(parts))
+
+    def __str__(self):
+        return str(list(self))
+
+    def __repr__(self):
+        return self.__str__()
@@ -0,0 +1,98 @@
+from collections import OrderedDict
+
+from environments import Environment, NoisyEnv
+
+
+class LRUCache:
+    """ Results of a function of hashable arguments, with LRU eviction """
+
+    def __init__(self, function, capacity):
+        self.function = function
+        self.capacity = capacity
+        # arguments -> result, least recently used first
+        self._entries = OrderedDict()
+
+        # counters for stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __call__(self, *args):
+        entries = self._entries
+        try:
+            result = entries[args]
+        except KeyError:
+            self.misses += 1
+            result = entries[args] = self.function(*args)
+            if len(entries) > self.capacity:
+                entries.popitem(last=False)
+                self.evictions += 1
+            return result
+        self.hits += 1
+        entries.move_to_end(args)
+        return result
+
+    def stats(self):
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
+
+
+class CachedEnv(NoisyEnv):
+    """ A NoisyEnv that memoizes the answers of another one
+
+    For environments too large or too lazily defined for compile_env(): the
+    successor distributions (sorted, as PAndOrPlanner.extended_next_states
+    uses them), observations and legal actions of the states the search
+    visits are kept in bounded LRU caches, so that only the first visit pays
+    for the Python code of the environment. Goal membership is a lookup in
+    the set of goal states, unless the environment overrides is_goal_state().
+
+    The cached lists are shared between the callers and must not be modified.
+    """
+
+    def __init__(self, env, capacity=100000):
+        """
+        :param capacity: maximum number of entries of each cache
+        """
+        self.env = env
+        self.capacity = capacity
+        self.next_states_p = LRUCache(env.next_states_p, capacity)
+        self.next_states_p_sorted = LRUCache(env.next_states_p_sorted, capacity)
+        self.get_obs = LRUCache(env.get_obs, capacity)
+        self.legal_actions = LRUCache(env.legal_actions, capacity)
+        if type(env).is_goal_state is Environment.is_goal_state:
+            self._goal_states = frozenset(env.goal_states)
+            self.is_goal_state = self._goal_states.__contains__
+        else:
+            self._goal_states = None
+            self.is_goal_state = LRUCache(env.is_goal_state, capacity)
+        self._init_states_p = env.init_states_p
+
+        super().__init__()
+
+    @property
+    def init_states_p(self):
+        return self._init_states_p
+
+    @property
+    def goal_states(self):
+        return self.env.goal_states
+
+    def str_state(self, s):
+        return self.env.str_state(s)
+
+    def str_action(self, a):
+        return self.env.str_action(a)
+
+    def str_obs(self, o):
+        return self.env.str_obs(o)
+
+    def stats(self):
+        caches = {'next_states_p': self.next_states_p, 'next_states_p_sorted': self.next_states_p_sorted,
+                  'get_obs': self.get_obs, 'legal_actions': self.legal_actions}
+        if self._goal_states is None:
+            caches['is_goal_state'] = self.is_goal_state
+        return {name: cache.stats() for name, cache in caches.items()}
@@ -0,0 +1,86 @@
+import json
+import time
+
+
+class SearchMetrics:
+    """ Counters of the search per history depth, and the time spent in its phases
+
+    PAndOrPlanner counts the events of its OR nodes and AND decisions with
+    count() when its metrics attribute is set, and wraps its alpha updates
+    with timed(). Both are skipped entirely otherwise.
+    """
+    EVENTS = (
+        'or_steps',         # OR nodes entered (num_steps)
+        'or_expansions',    # (q_next, action) candidates tried at branching OR nodes
+        'goal',             # runs terminated in a goal state
+        'not_goal',         # runs terminated in a non-goal state
+        'loops',            # runs looping back to a level of the history
+        'noters',           # certain loops
+        'illegal',          # transitions to an illegal action
+        'nogood_prunes',
+        'cuts',             # OR nodes below the path probability of the approximate search
+        'transpositions',
+        'and_successes',    # AND steps that reached lpc_desired
+        'and_fails',        # AND steps that cannot reach lpc_desired anymore
+    )
+    # phases wrapped by timed(), whose calls are counted per depth too
+    PHASES = ('calc_lambda', 'cumulate_alpha', 'extend_alpha')
+
+    def __init__(self, sample_path=None, sample_interval=10.):
+        """
+        :param sample_path: if given, the totals are appended to this file as
+            a JSON line every sample_interval seconds of the search
+        """
+        self.sample_path = sample_path
+        self.sample_interval = sample_interval
+        self.start()
+
+    def start(self):
+        """ Resets the metrics, called by PAndOrPlanner.init_search """
+        # event -> list of counts by depth
+        self.counts = {name: [] for name in self.EVENTS + self.PHASES}
+        self.seconds = dict.fromkeys(self.PHASES, 0.)
+        self.start_time = time.perf_counter()
+        self.next_sample = self.start_time + self.sample_interval
+        if self.sample_path is not None:
+            open(self.sample_path, 'w').close()
+
+    def count(self, event, depth):
+        counts = self.counts[event]
+        if depth >= len(counts):
+            counts.extend([0] * (depth + 1 - len(counts)))
+        counts[depth] += 1
+
+    def timed(self, phase, function):
+        """ function(alpha, history, ...), counting its calls by len(history) and its time in phase """
+        perf_counter = time.perf_counter
+
+        def wrapper(alpha, history, *args, **kwargs):
+            start = perf_counter()
+            result = function(alpha, history, *args, **kwargs)
+            self.seconds[phase] += perf_counter() - start
+            self.count(phase, len(history))
+            return result
+        return wrapper
+
+    def tick(self, num_steps):
+        """ Called every few OR steps; appends a sample if it is time """
+        if self.sample_path is not None and time.perf_counter() >= self.next_sample:
+            sample = {'seconds': time.perf_counter() - self.start_time, 'num_steps': num_steps,
+                      'totals': self.totals(), 'phase_seconds': dict(self.seconds)}
+            with open(self.sample_path, 'a') as f:
+                f.write(json.dumps(sample) + '\n')
+            self.next_sample = time.perf_counter() + self.sample_interval
+
+    def totals(self):
+        return {name: sum(counts) for name, counts in self.counts.items()}
+
+    def to_dict(self):
+        return {'seconds': time.perf_counter() - self.start_time,
+                'totals': self.totals(),
+                'phase_seconds': dict(self.seconds),
+                'by_depth': self.counts}
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
@@ -0,0 +1,156 @@
+import math
+from collections import OrderedDict
+
+
+class NogoodStore:
+    """ Failure likelihoods learnt from finished subtrees of the search, with LRU eviction
+
+    When the AND step below an OR node (q, s) is finished, the runs of its
+    subtree end in 'fail' or never terminate with likelihood g (relative to
+    reaching (q, s)), up to the runs that loop back above (q, s). These runs
+    only depend on the transitions N of the controller that they read, so
+    any controller that contains N fails with likelihood at least g from
+    (q, s), whatever the history. The store keeps (q, s, N) -> g for the
+    largest g seen; the OR step looks it up before simulating (q, s) again
+    (see PAndOrPlanner.nogood_prunes), and drops the branch if counting g as
+    failing already makes lpc_desired unreachable.
+
+    To find N, the store also keeps a log of the (level, (q, obs)) entries
+    of the controller used by the OR nodes on the current branch: the
+    subtree of the node at level L is the suffix of the log after the last
+    entry at level L. N leaves out the entries whose subtree neither fails
+    nor loops back to a level >= L, as their runs end in 'win' or leave the
+    subtree of (q, s) whatever they do, and a smaller N matches more
+    controllers. The log also marks the certain loops (key None): the runs
+    that never terminate only count in g if none of them loops back above
+    (q, s), as they would depend on the history otherwise.
+    """
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        # (q, s, N) -> pivot, least recently used first
+        self._entries = OrderedDict()
+        # (q, s) -> pivot -> N -> g, where the pivot is a transition of N (None if N is empty):
+        # a lookup only looks at the N whose pivot is in the controller
+        self._by_node = {}
+        self._log = []
+
+        # counters for stats
+        self.lookups = 0
+        self.hits = 0
+        self.prunes = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def enter(self, level, key, reach=None):
+        """ The OR node at level `level` uses the controller entry `key`
+
+        :param reach: as in settle; until the entry is settled, it counts as failing"""
+        self._log.append([level, key, reach])
+
+    def enter_loop(self, level, target):
+        """ The node at level `level` loops back to the node at level `target` for sure """
+        self._log.append([level, None, target])
+
+    def loops_forever(self, level):
+        """ The runs of the OR node at level `level` on the branch loop back to it for sure:
+        settles the entries of its subtree so far as failing, as calc_lambda drops their
+        loops, from which settle() would learn where they loop back to """
+        log = self._log
+        for i in range(self._find(level), len(log)):
+            if log[i][1] is not None:
+                log[i][2] = math.inf
+
+    def _find(self, level):
+        """ Position in the log of the last OR node at level `level` """
+        log = self._log
+        start = len(log) - 1
+        while log[start][0] != level:
+            start -= 1
+        return start
+
+    def settle(self, level, reach):
+        """ The subtree of the last OR node at level `level` fails if reach is infinite,
+        else its runs loop back at most up to level reach (-1 if they do not loop back)
+
+        A failing entry stays so, as the branches of a node share its entry."""
+        entry = self._log[self._find(level)]
+        if entry[2] != math.inf:
+            entry[2] = reach
+
+    def mark(self):
+        """ Returns a position of the log that can be passed to truncate() """
+        return len(self._log)
+
+    def truncate(self, mark):
+        """ Forgets the entries logged by the branches abandoned since mark """
+        del self._log[mark:]
+
+    def record(self, c, level, q, s, fail, noter):
+        """ The subtree of the OR node (q, s) at level `level` ended in 'fail' with likelihood
+        `fail`, and never terminated with likelihood `noter`: settles it as failing """
+        log = self._log
+        start = self._find(level)
+        log[start][2] = math.inf
+        transitions = c.transitions
+        used = []
+        for _, key, reach in log[start:]:
+            if key is None:
+                if reach < level:
+                    noter = 0.
+            elif (reach is None or reach >= level) and key in transitions:
+                used.append((key, transitions[key]))
+        g = fail + noter
+        if g == 0.:
+            return
+        # the deepest transition is the least likely to be in other controllers
+        pivot = used[-1] if used else None
+        used = frozenset(used)
+
+        entry = (q, s, used)
+        if entry in self._entries:
+            self._entries.move_to_end(entry)
+            pivot = self._entries[entry]
+            bucket = self._by_node[q, s][pivot]
+            if g <= bucket[used]:
+                return
+        else:
+            self._entries[entry] = pivot
+            bucket = self._by_node.setdefault((q, s), {}).setdefault(pivot, {})
+        bucket[used] = g
+
+        while len(self._entries) > self.capacity:
+            (q_old, s_old, used_old), pivot_old = self._entries.popitem(last=False)
+            node = self._by_node[q_old, s_old]
+            del node[pivot_old][used_old]
+            if not node[pivot_old]:
+                del node[pivot_old]
+                if not node:
+                    del self._by_node[q_old, s_old]
+            self.evictions += 1
+
+    def lookup(self, c, q, s):
+        """ The largest g stored for (q, s) whose transitions are all in c, or 0. """
+        self.lookups += 1
+        node = self._by_node.get((q, s))
+        if not node:
+            return 0.
+
+        transitions = c.transitions.items()
+        best, best_used = 0., None
+        for pivot in None, *transitions:
+            bucket = node.get(pivot)
+            if bucket is not None:
+                for used, g in bucket.items():
+                    if g > best and transitions >= used:
+                        best, best_used = g, used
+        if best_used is not None:
+            self.hits += 1
+            self._entries.move_to_end((q, s, best_used))
+        return best
+
+    def stats(self):
+        return {'entries': len(self._entries), 'lookups': self.lookups, 'hits': self.hits,
+                'prunes': self.prunes, 'evictions': self.evictions}
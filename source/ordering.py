@@ -0,0 +1,89 @@
+"""
+Orders in which an OR node of the search tries its (q_next, action) candidates
+
+The candidates come from PAndOrPlanner.get_mealy_qa_iterator in q-major,
+legal_actions() order. An ordering only permutes them, so the search stays
+complete; it finds the first controller of the order it explores.
+"""
+
+from collections import Counter
+
+from controller import A_STOP
+from heuristic import goal_reach_bounds
+
+
+class CandidateOrdering:
+    """ The default order: q_next-major, then the order of env.legal_actions() """
+    name = 'default'
+    # whether order() depends on the search so far (see exhausted())
+    stateful = False
+
+    def start(self, planner):
+        """ Called by PAndOrPlanner.init_search before the search """
+        pass
+
+    def order(self, c, q, s, obs, candidates):
+        """ The candidates for c[q, obs] at env state s, in the order to try them """
+        return candidates
+
+    def exhausted(self, q, obs, q_next, action):
+        """ Called when the search below c[q, obs] = q_next, action found no controller """
+        pass
+
+
+class GoalValueOrdering(CandidateOrdering):
+    """ Actions with the highest expected goal_reach_bounds of their successors first """
+    name = 'goal-value'
+
+    def __init__(self):
+        self.env = None
+        self.bounds = None
+        self._values = {}
+
+    def start(self, planner):
+        if self.env is not planner.env:
+            self.env = planner.env
+            self.bounds = planner.goal_bounds or goal_reach_bounds(planner.env)
+            self._values = {}
+
+    def order(self, c, q, s, obs, candidates):
+        if s not in self._values:
+            values = {action: sum(p * self.bounds.get(s_next, 1.)
+                                  for s_next, p in self.env.next_states_p(s, action))
+                      for action in self.env.legal_actions(s)}
+            values[A_STOP] = 1. if self.env.is_goal_state(s) else 0.
+            self._values[s] = values
+        values = self._values[s]
+        # stable: q-major among the actions of equal value
+        return sorted(candidates, key=lambda candidate: -values[candidate[1]])
+
+
+class ReuseOrdering(CandidateOrdering):
+    """ The controller states that most transitions already lead to first, a new state last """
+    name = 'reuse'
+
+    def order(self, c, q, s, obs, candidates):
+        uses = Counter(q_next for q_next, _ in c.transitions.values())
+        num_states = c.num_states
+        return sorted(candidates, key=lambda candidate: (candidate[0] == num_states, -uses[candidate[0]]))
+
+
+class LearnedOrdering(CandidateOrdering):
+    """ The transitions whose subtrees were exhausted least often so far first """
+    name = 'learned'
+    stateful = True
+
+    def __init__(self):
+        self.failures = Counter()
+
+    def start(self, planner):
+        self.failures.clear()
+
+    def order(self, c, q, s, obs, candidates):
+        return sorted(candidates, key=lambda candidate: self.failures[q, obs, candidate])
+
+    def exhausted(self, q, obs, q_next, action):
+        self.failures[q, obs, (q_next, action)] += 1
+
+
+ORDERINGS = {cls.name: cls for cls in (CandidateOrdering, GoalValueOrdering, ReuseOrdering, LearnedOrdering)}
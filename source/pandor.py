@@ -8,48 +8,119 @@ Probabilistic AND-OR search algorithm for a finite-state controller in a stochas
 
 import argparse
 import logging
+import math
 import timeit
 import time
 import copy
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 from typing import Tuple, Iterator
 
-from controller import MealyController
+from controller import MealyController, A_STOP
+from trail import Trail
+from history import History
+from alpha import Alpha, WIN, FAIL, NOTER, UNKNOWN, base
 import environments
-
-NEW_ROWS = 5
+from evaluate import evaluate_controller
+from simulate import simulate_controller
+from heuristic import goal_reach_bounds
+from ordering import ORDERINGS
+from and_ordering import SUCCESSOR_ORDERINGS
+from nogood import NogoodStore
+from transposition import TranspositionTable
+from metrics import SearchMetrics
+from tracing import SearchTrace
+from checkpoint import Checkpoint, VERSION as CHECKPOINT_VERSION, save_checkpoint, load_checkpoint, env_fingerprint
+from tabular import compile_env
+from memo import CachedEnv
 
 S_WIN = "win"
 S_FAIL = "fail"
-A_STOP = "stop"
 
 PRINT_WAIT_SECONDS = 1
 
-# verbose flag
-v = False
-
 
 class PandorControllerNotFound(ValueError):
     pass
 
 
-class HistoryItem:
-    def __init__(self, q, s, p):
-        self.q = q
-        self.s = s
-        self.p = p
+class PandorSearchCancelled(Exception):
+    """ Raised in a search whose PAndOrPlanner.stop_event was set """
+    pass
+
+
+class PandorBudgetExceeded(PandorSearchCancelled):
+    """ Raised in a search that ran out of its PAndOrPlanner.budget """
+    pass
+
+
+def _assign(alpha, index, value):
+    """alpha.data[index] = value, without recording it on a trail"""
+    alpha.set(index, value)
+
 
-    def __str__(self):
-        return f"(q: {self.q}, s: {self.s}, p: {self.p:0.1f})"
+class _LambdaCache:
+    """ The loop likelihoods of the last calc_lambda call on an alpha, per level k:
+    likelihoods_loop[k], the last level end[k] of its row that it read, and the
+    factor folded[k] = p[k] / (1 - likelihoods_loop[k]) that the rows above k used """
+    __slots__ = ('likelihoods_loop', 'end', 'folded')
 
-    def __repr__(self):
-        return self.__str__()
+    def __init__(self, likelihoods_loop, end, folded):
+        self.likelihoods_loop = likelihoods_loop
+        self.end = end
+        self.folded = folded
 
-    def __eq__(self, other):
-        """ self.p == None is a wildcard"""
-        return self.q == other.q and \
-               self.s == other.s and \
-               ((self.p is None) or (other.p is None) or self.p == other.p)
+
+class SearchBudget:
+    """ Limits on the wall-clock time and the number of steps of a search """
+    __slots__ = ('deadline', 'max_steps')
+
+    def __init__(self, seconds=None, max_steps=None):
+        self.deadline = time.perf_counter() + seconds if seconds is not None else None
+        self.max_steps = max_steps
+
+    def exceeded(self, num_steps):
+        if self.max_steps is not None and num_steps > self.max_steps:
+            return True
+        # the clock is read every 256 steps
+        return self.deadline is not None and not num_steps & 0xff and time.perf_counter() > self.deadline
+
+
+class OrFrame:
+    """ One OR node on the explicit stack of PAndOrPlanner.iterative_search
+
+    The AND step that called the OR step is not a frame of its own: it is
+    identified by (history, sl_next, index), i.e. the OR node simulates
+    sl_next[index] at level len(history). Results of the AND step below
+    this node are reported to the AND step this node belongs to, which is
+    the node's `parent`'s level.
+    """
+    __slots__ = ('c', 'q', 's', 'p', 'history', 'alpha', 'sl_next', 'index',
+                 'parent', 'terminal', 'new_history', 'obs', 'candidates', 'pos', 'mark',
+                 'log_mark', 'branchings')
+
+    def __init__(self, c, q, sl_next, index, history, alpha, parent):
+        self.c = c
+        self.q = q
+        self.s, self.p = sl_next[index]
+        self.sl_next = sl_next
+        self.index = index
+        self.history = history
+        self.alpha = alpha
+        self.parent = parent
+
+        # True if the node has no AND step below it and yields exactly once
+        self.terminal = True
+        self.new_history = None
+        self.obs = None
+        # (q_next, action) candidates of a branching node, and the one being tried
+        self.candidates = None
+        self.pos = 0
+        self.mark = None
+        self.log_mark = None
+        # number of branching nodes on the stack up to and including this one
+        self.branchings = 0
 
 
 class PAndOrPlanner:
@@ -58,73 +129,410 @@ class PAndOrPlanner:
         # Lower/upper bound for the LPC of the current controller
         self.lpc_desired = None
         self.num_steps = None
+        # Undo trail of the in-place search, None when deep-copying
+        self.trail = None
+        # Set by another process to stop the search (see parallel_search)
+        self.stop_event = None
+        # Choice indices forced on the first branching OR nodes, and the
+        # callback for the branching nodes at split_depth (see iterative_search)
+        self.forced_choices = ()
+        self.split_depth = None
+        self.on_split = None
+        # (num_steps, num_candidates) when a search with forced_choices first
+        # entered the node below them: the steps replaying the path to it
+        self.replayed = None
+        # Upper bounds of the goal termination likelihood of the env states, None
+        # when the search does not use them (see goal_reach_bounds)
+        self.goal_bounds = None
+        # Order of the candidates of OR nodes (see ordering.py)
+        self.ordering = ORDERINGS['default']()
+        # Order of the successors of AND steps (see and_ordering.py)
+        self.and_ordering = SUCCESSOR_ORDERINGS['likely']()
+        self.num_candidates = None
+        # Failure likelihoods learnt from finished subtrees, None when not used
+        self.nogoods = None
+        # Likelihoods of the subtrees that the controller determines, None when not used
+        self.transpositions = None
+        # One dict per bound tried by synth_smallest
+        self.bound_stats = []
+        # SearchBudget of the search, None if unlimited
+        self.budget = None
+        # (lower bound, upper bound, controller) with the best lower bound of the LGT
+        # seen at an AND step, None if not tracked (see synth_anytime)
+        self.best = None
+        # File that the iterative search saves its checkpoints to, None if it does not
+        self.checkpoint_path = None
+        self.checkpoint_interval = None
+        self.next_checkpoint = None
+        self.search_params = None
+        # Checkpoint that the search is replaying up to, None if it is not resuming
+        self.resuming = None
+        # SearchMetrics filled by the search, None if it is not instrumented
+        self.metrics = None
+        # Path probability below which the OR nodes are cut off, 0. for an exact search
+        self.approx = 0.
+        # Largest unknown likelihood that the approximate search counts as reaching the goal
+        self.approx_error = 0.
+        # SearchTrace given for the searches, and the one of the current search: the
+        # given one, one sending the events to logging if it is enabled, or None
+        self.trace = None
+        self.tracer = None
+
+    def synth_plan(self, states_bound, lpc_desired, backtracking='copy', engine='recursive',
+                   workers=None, split_depth=2, heuristic=False, ordering='default', and_ordering='likely',
+                   nogoods=0, transpositions=0, reuse=False, approx=0., approx_error=0., checkpoint=None, checkpoint_interval=60., resume=False):
+        """
+        :param engine: 'recursive' runs the search as nested and_step/or_step
+            generators; 'iterative' runs the same search on an explicit stack
+            (see iterative_search), with no recursion limit on the history depth;
+            'parallel' splits the iterative search into subtrees run by a
+            process pool (see parallel_search).
+        :param backtracking: 'copy' deep-copies the controller and alpha at
+            every OR branch; 'trail' modifies them in place and undoes the
+            changes on backtracking. Both explore the same search tree.
+        :param workers: number of worker processes of the parallel engine
+            (default: number of CPUs)
+        :param split_depth: the parallel engine makes a work unit of every
+            combination of choices at the first split_depth branching OR nodes
+        :param heuristic: if True, the AND steps count the successors they did not
+            simulate yet as failing with at least 1 - goal_reach_bounds(env)[s],
+            instead of 0, when deciding whether the controller can still reach
+            lpc_desired. This prunes the same branches earlier, so the controller
+            found is the same.
+        :param ordering: name of the order in which OR nodes try their
+            (q_next, action) candidates, see ordering.ORDERINGS
+        :param and_ordering: name of the order in which AND steps simulate the
+            successor states, see and_ordering.SUCCESSOR_ORDERINGS
+        :param nogoods: if positive, the OR steps skip the nodes that a NogoodStore
+            of this many entries shows to fail
+        :param transpositions: if positive, the OR steps take the likelihoods of
+            the subtrees that the controller already determines from a
+            TranspositionTable of this many entries, instead of simulating them.
+            These are the exact likelihoods of the subtrees, so the search can
+            decide earlier, and may find another controller than without the table.
+        :param reuse: keep what the previous search of this planner learnt, see init_search
+        :param approx, approx_error: see init_search
+        :param checkpoint: path of a file that the iterative engine saves its
+            frontier to every checkpoint_interval seconds (see checkpoint.py)
+        :param resume: continue the search saved in the checkpoint file by a
+            search with the same arguments, which then goes on exactly as it would have
+        """
+        cont, alpha = self.init_search(states_bound, lpc_desired, backtracking, heuristic, ordering, nogoods,
+                                       transpositions, reuse, approx, approx_error, and_ordering)
+        if engine not in ('recursive', 'iterative', 'parallel'):
+            raise ValueError(f"Unknown search engine: {engine}")
+        if engine == 'parallel' and self.ordering.stateful:
+            # the work units would order the candidates differently than the splitting search
+            raise ValueError(f"The {ordering} ordering cannot be used by the parallel engine")
+        if engine == 'parallel' and self.and_ordering.dynamic:
+            # the work units would not reach the AND steps with the bounds of the splitting search
+            raise ValueError(f"The {and_ordering} successor ordering cannot be used by the parallel engine")
+        if engine == 'parallel' and self.metrics is not None:
+            raise ValueError("The parallel engine does not collect metrics")
+        if checkpoint is not None:
+            if engine != 'iterative':
+                raise ValueError("Checkpoints need the iterative engine")
+            self.search_params = {'env': env_fingerprint(self.env), 'states_bound': states_bound, 'lpc_desired': lpc_desired,
+                                  'backtracking': backtracking, 'heuristic': heuristic, 'ordering': ordering,
+                                  'and_ordering': and_ordering,
+                                  'nogoods': nogoods, 'transpositions': transpositions, 'approx': approx,
+                                  'approx_error': approx_error}
+            if resume:
+                self.resuming = load_checkpoint(checkpoint)
+                if self.resuming.params != self.search_params:
+                    params, self.resuming = self.resuming.params, None
+                    other = [key for key in self.search_params if params.get(key) != self.search_params[key]]
+                    raise ValueError(f"Checkpoint {checkpoint} was saved by a search with other arguments: "
+                                     + ", ".join(other))
+                # the replay neither uses nor learns nogoods, the checkpoint has them
+                self.nogoods = None
+            self.checkpoint_path, self.checkpoint_interval = checkpoint, checkpoint_interval
+            self.next_checkpoint = time.perf_counter() + checkpoint_interval
+        elif resume:
+            raise ValueError("Resuming needs a checkpoint file")
+
+        empty_history = History()
+        sl_init = self.and_ordering.order(self.env.init_states_p)
+
+        try:
+            if engine == 'recursive':
+                good_cont, good_alpha = next(self.and_step(cont, cont.init_state, sl_init, empty_history, alpha))
+            elif engine == 'iterative':
+                good_cont, good_alpha = self.iterative_search(cont, cont.init_state, sl_init, alpha)
+            else:
+                good_cont, good_alpha = self.parallel_search(cont, cont.init_state, sl_init, alpha,
+                                                             workers, split_depth)
+            print("Controller found with max ", states_bound, "states.")
+            return good_cont, self.calc_lambda(good_alpha, empty_history, trail=self.trail)
+        except StopIteration:
+            print("No controller found with max ", states_bound, "states.")
+            raise PandorControllerNotFound
+        finally:
+            self.checkpoint_path = self.resuming = None
+
+    def synth_anytime(self, states_bound, lpc_desired, seconds=None, max_steps=None, tighten=None,
+                      backtracking='copy', engine='recursive', **kwargs):
+        """ Searches until a budget runs out, and returns the controller with the best LGT seen
+
+        At every AND step, the likelihoods of the controller built so far bound the
+        LGT of all its completions. The controller with the highest lower bound is
+        kept, and returned when the search ends: after the first controller found,
+        when the budget runs out, or when the search space is exhausted.
+
+        :param seconds: wall-clock budget of the search, None for no limit
+        :param max_steps: budget of num_steps, None for no limit
+        :param tighten: if given, after every controller found the search goes on
+            with lpc_desired raised to its LGT lower bound + tighten, until the
+            budget runs out or no better controller is found
+        :param engine: 'recursive' or 'iterative'
+        :param kwargs: the other arguments of init_search
+        :returns: the best controller, which may leave some (q, obs) undefined,
+            and the interval (lower, upper) of the LGT of all its completions
+        :raises PandorControllerNotFound: if no controller had a positive lower bound
+        """
+        cont, alpha = self.init_search(states_bound, lpc_desired, backtracking, **kwargs)
+        sl_init = self.and_ordering.order(self.env.init_states_p)
+        if engine == 'recursive':
+            results = self.and_step(cont, cont.init_state, sl_init, History(), alpha)
+        elif engine == 'iterative':
+            results = self.iterative_results(cont, cont.init_state, sl_init, alpha)
+        else:
+            raise ValueError(f"Unknown search engine for the anytime search: {engine}")
 
-    def synth_plan(self, states_bound, lpc_desired):
+        self.best = (0., 1., None)
+        self.budget = SearchBudget(seconds, max_steps)
+        try:
+            for good_cont, good_alpha in results:
+                likelihoods = self.calc_lambda(good_alpha, History(), trail=self.trail)
+                self.record_best(good_cont, likelihoods)
+                lpc_desired = likelihoods['win'] + tighten if tighten is not None else 1.
+                if lpc_desired >= 1.:
+                    break
+                logging.info("Anytime: LGT >= %s found, searching for LGT >= %s", likelihoods['win'], lpc_desired)
+                self.lpc_desired = lpc_desired
+        except PandorBudgetExceeded:
+            logging.info("Anytime: budget exceeded")
+        finally:
+            results.close()
+            lower, upper, best_cont = self.best
+            self.best = self.budget = None
+
+        if best_cont is None:
+            print("No controller found with max ", states_bound, "states.")
+            raise PandorControllerNotFound
+        print("Best controller with max ", states_bound, "states has LGT in [{}, {}].".format(lower, upper))
+        return best_cont, (lower, upper)
+
+    def iter_plans(self, states_bound, lpc_desired, limit=None, backtracking='copy', engine='recursive', **kwargs):
+        """ Yields the controllers with LGT >= lpc_desired that the search reaches, as it finds them
+
+        The search goes on after each controller found, so the controllers come
+        in the order of the search tree, each as soon as it is found. Controllers
+        equal up to renaming their states are yielded once. The search is
+        suspended while the consumer handles a controller, and abandoned when
+        the consumer stops iterating.
+
+        These are not all the controllers within the bound that reach
+        lpc_desired: an AND step stops at its first success, without
+        simulating its other successors, and the order of the successors
+        (and_ordering) decides which (q, obs) entries are defined first, and
+        from which state. E.g. iter_plans(3, 0.3) on LoopyTest yields 1
+        controller with the default and_ordering, of LGT 0.5, but 6 with
+        'unlikely' or 'fail-first', 3 of them of LGT 0.66.
+
+        :param limit: stop after this many controllers, None for all of them
+        :param engine: 'recursive' or 'iterative'
+        :param kwargs: the other arguments of init_search
+        :returns: iterator of (controller, likelihoods); a controller may leave
+            (q, obs) entries undefined, those that the successors simulated by
+            its AND steps do not reach. The runs of the successors that an AND
+            step skipped after its success may reach them; the likelihoods
+            count those runs in neither win nor fail, so the LGT of any
+            completion of the controller is in [win, 1 - fail - noter].
+        """
+        cont, alpha = self.init_search(states_bound, lpc_desired, backtracking, **kwargs)
+        sl_init = self.and_ordering.order(self.env.init_states_p)
+        if engine == 'recursive':
+            results = self.and_step(cont, cont.init_state, sl_init, History(), alpha)
+        elif engine == 'iterative':
+            results = self.iterative_results(cont, cont.init_state, sl_init, alpha)
+        else:
+            raise ValueError(f"Unknown search engine for enumerating controllers: {engine}")
+
+        seen = set()
+        try:
+            for good_cont, good_alpha in results:
+                key = good_cont.canonical_form()
+                if key in seen:
+                    continue
+                seen.add(key)
+                # the search modifies or reuses both once it goes on
+                yield copy.deepcopy(good_cont), self.calc_lambda(good_alpha, History(), trail=self.trail)
+                if limit is not None and len(seen) >= limit:
+                    break
+        finally:
+            results.close()
+
+    def record_best(self, c, likelihoods):
+        """ Keeps a copy of c if its LGT lower bound is the best so far """
+        if likelihoods['win'] > self.best[0]:
+            upper = min(1., 1 - likelihoods['fail'] - likelihoods['noter'])
+            self.best = (float(likelihoods['win']), float(upper), copy.deepcopy(c))
+
+    def synth_smallest(self, min_states, max_states, lpc_desired, **kwargs):
+        """ Runs synth_plan with the bounds min_states, min_states + 1, ..., max_states,
+        each search reusing what the previous ones learnt
+
+        Appends the bound, whether a controller was found, num_steps and the
+        seconds taken of each search to self.bound_stats.
+
+        :param kwargs: the other arguments of synth_plan
+        :returns: the first controller found, its likelihoods and its bound
+        :raises PandorControllerNotFound: if no bound up to max_states has a controller
+        """
+        self.bound_stats = []
+        for states_bound in range(min_states, max_states + 1):
+            start = time.perf_counter()
+            try:
+                cont, likelihoods = self.synth_plan(states_bound, lpc_desired, reuse=states_bound > min_states,
+                                                    **kwargs)
+                found = True
+            except PandorControllerNotFound:
+                found = False
+            self.bound_stats.append({'bound': states_bound, 'found': found, 'num_steps': self.num_steps,
+                                     'seconds': time.perf_counter() - start})
+            if found:
+                return cont, likelihoods, states_bound
+
+        raise PandorControllerNotFound
+
+    def init_search(self, states_bound, lpc_desired, backtracking='copy', heuristic=False, ordering='default',
+                    nogoods=0, transpositions=0, reuse=False, approx=0., approx_error=0., and_ordering='likely'):
+        """ Resets the planner for a new search, and returns the empty controller and alpha
+
+        :param reuse: keep the goal_reach_bounds, the state of the ordering and
+            the nogoods of the previous search, instead of starting afresh. None
+            of them depends on the bound or on lpc_desired. The transposition
+            table is always kept, and the metrics go on counting.
+        :param approx: if positive, an OR node whose path probability is
+            below approx (see approx_cut) is not simulated: its p goes to the
+            'unknown' likelihood instead.
+        :param approx_error: while the unknown likelihood is at most
+            approx_error, the AND steps count the unknown runs as reaching the
+            goal, and once it exceeds approx_error as not reaching it (see
+            approx_bounds). So a controller found has win >= lpc_desired -
+            approx_error, and its LGT is in [win, 1 - fail - noter], which
+            contains the unknown likelihood. With approx_error = 0 the search
+            may give up on controllers that the exact search finds.
+        """
         self.lpc_desired = lpc_desired
+        self.approx, self.approx_error = approx, approx_error
+        if not heuristic:
+            self.goal_bounds = None
+        elif not (reuse and self.goal_bounds is not None):
+            self.goal_bounds = goal_reach_bounds(self.env)
+        if ordering not in ORDERINGS:
+            raise ValueError(f"Unknown candidate ordering: {ordering}")
+        if ordering != self.ordering.name:
+            self.ordering = ORDERINGS[ordering]()
+            self.ordering.start(self)
+        elif not reuse:
+            self.ordering.start(self)
+        if and_ordering not in SUCCESSOR_ORDERINGS:
+            raise ValueError(f"Unknown successor ordering: {and_ordering}")
+        if and_ordering != self.and_ordering.name:
+            self.and_ordering = SUCCESSOR_ORDERINGS[and_ordering]()
+        self.and_ordering.start(self)
+        if not nogoods:
+            self.nogoods = None
+        elif reuse and self.nogoods is not None and self.nogoods.capacity == nogoods:
+            self.nogoods.truncate(0)
+        else:
+            self.nogoods = NogoodStore(nogoods)
+        if not transpositions:
+            self.transpositions = None
+        elif self.transpositions is None or self.transpositions.capacity != transpositions:
+            self.transpositions = TranspositionTable(self.env, transpositions)
+        if backtracking == 'copy':
+            self.trail = None
+        elif backtracking == 'trail':
+            self.trail = Trail()
+        else:
+            raise ValueError(f"Unknown backtracking mode: {backtracking}")
 
         # counters for stats
         self.num_steps = 0
-
-        cont = MealyController(states_bound)
-
-        alpha = {'win': [0.],
-                 'fail': [0.],
-                 'noter': [0.],
-                 'loop': np.array([[0.]])}
+        self.num_candidates = 0
+        for phase in SearchMetrics.PHASES:
+            if self.metrics is None:
+                self.__dict__.pop(phase, None)
+            else:
+                # shadows the static method for this planner only, so the search pays nothing without metrics
+                setattr(self, phase, self.metrics.timed(phase, getattr(PAndOrPlanner, phase)))
+        if self.metrics is not None and not reuse:
+            self.metrics.start()
+        if self.trace is not None:
+            self.tracer = self.trace
+        elif logging.getLogger().isEnabledFor(logging.INFO):
+            self.tracer = SearchTrace(self.env, log=True)
+        else:
+            self.tracer = None
 
         # For numerical stability, lpc_desired must be lower than 1.
         assert lpc_desired < 1.0
 
-        empty_history = []
-
-        try:
-            good_cont, good_alpha = next(self.and_step(cont, cont.init_state, self.env.init_states_p, empty_history, alpha))
-            print("Controller found with max ", states_bound, "states.")
-            return good_cont, self.calc_lambda(good_alpha, empty_history)
-        except StopIteration:
-            print("No controller found with max ", states_bound, "states.")
-            raise PandorControllerNotFound
-
+        return MealyController(states_bound), Alpha()
 
     def and_step(self, c: MealyController, q, sl_next, history, alpha) \
             -> Iterator[Tuple[MealyController, dict]]:
 
         if sl_next == []:
-            self.cumulate_alpha(alpha, history)
+            if self.nogoods is not None:
+                self.record_nogood(c, history, alpha)
+            self.cumulate_alpha(alpha, history, trail=self.trail)
             yield (c, alpha)
         else:
             s_next, p_next = sl_next[0]
-
-            logging.info("AND: Simulating s: %s, q: %s", self.env.str_state(s_next), q) if v else 0
+            tracer = self.tracer
+            if tracer is not None:
+                tracer.emit('or', len(history), q=q, s=s_next, p=p_next)
 
             self.extend_alpha(alpha, history)
 
             for x in self.or_step(c, q, s_next, p_next, history, alpha):
                 new_c, new_alpha = x
 
-                # logging.debug("AND: (before calc) alpha['loop'] = %s", new_alpha['loop'])
-                logging.debug("AND: (before calc) new_alpha['noter'] = %s", new_alpha['noter'])
-
-                likelihoods = self.calc_lambda(new_alpha, history)
+                likelihoods = self.calc_lambda(new_alpha, history, trail=self.trail,
+                                               pending_fail=self.pending_fail(sl_next, 1), on_noter=self.on_noter)
 
-                # logging.debug("AND: (after  calc) alpha['loop'] = %s", new_alpha['loop'])
-                logging.debug("AND: (after  calc) alpha['noter'] = %s", new_alpha['noter'])
-                logging.debug("AND: likelihoods: %s", likelihoods)
                 lpc_lower_bound = likelihoods['win']
                 lpc_upper_bound = 1 - likelihoods['fail'] - likelihoods['noter']
+                if likelihoods['unknown']:
+                    lpc_lower_bound, lpc_upper_bound = self.approx_bounds(likelihoods)
+                if self.best is not None and likelihoods['win'] > self.best[0]:
+                    self.record_best(new_c, likelihoods)
 
                 if lpc_lower_bound >= self.lpc_desired:
-                    logging.info("AND: succeed at history %s", history)
-                    yield (new_c, self.cumulate_alpha(new_alpha, history))
+                    if tracer is not None:
+                        tracer.emit('and_success', len(history), win=lpc_lower_bound, upper=lpc_upper_bound)
+                    if self.metrics is not None:
+                        self.metrics.count('and_successes', len(history))
+                    yield (new_c, self.cumulate_alpha(new_alpha, history, trail=self.trail))
 
                 elif lpc_upper_bound < self.lpc_desired:
-                    logging.info("AND: fail at history %s", history)
-                    logging.info("AND (do nothing)")
-                    pass
+                    if tracer is not None:
+                        tracer.emit('and_fail', len(history), win=lpc_lower_bound, upper=lpc_upper_bound)
+                    if self.metrics is not None:
+                        self.metrics.count('and_fails', len(history))
 
                 else:
-                    yield from ((c_, self.cumulate_alpha(alpha_, history))
-                                for c_, alpha_ in self.and_step(new_c, q, sl_next[1:], history, new_alpha))
+                    if tracer is not None:
+                        tracer.emit('and_continue', len(history), win=lpc_lower_bound, upper=lpc_upper_bound)
+                    rest = sl_next[1:]
+                    if self.and_ordering.dynamic:
+                        rest = self.and_ordering.reorder(rest, 0, lpc_lower_bound, lpc_upper_bound, self.lpc_desired)
+                    yield from ((c_, self.cumulate_alpha(alpha_, history, trail=self.trail))
+                                for c_, alpha_ in self.and_step(new_c, q, rest, history, new_alpha))
 
 
     def or_step(self, c, q, s, p, history, alpha) \
@@ -135,67 +543,552 @@ class PAndOrPlanner:
 
         # for debugging/stats only
         self.num_steps += 1
+        if self.budget is not None and self.budget.exceeded(self.num_steps):
+            raise PandorBudgetExceeded
+        metrics, tracer = self.metrics, self.tracer
+        if metrics is not None:
+            metrics.count('or_steps', len(history))
+            if not self.num_steps & 0xff:
+                metrics.tick(self.num_steps)
+
+        trail = self.trail
+        assign = trail.assign if trail is not None else _assign
 
         if s is S_WIN:
             # len(history) is good because hist does not yet contain this step.
-            alpha['win'][len(history)] += p
-            logging.info("OR: terminated in goal state")
+            i = Alpha.index(WIN, len(history))
+            assign(alpha, i, alpha.data[i] + p)
+            if tracer is not None:
+                tracer.emit('goal', len(history))
+            if metrics is not None:
+                metrics.count('goal', len(history))
             yield c, alpha
 
         elif s is S_FAIL:
-            alpha['fail'][len(history)] += p
-            logging.info("OR: terminated in NOT goal state")
+            i = Alpha.index(FAIL, len(history))
+            assign(alpha, i, alpha.data[i] + p)
+            if tracer is not None:
+                tracer.emit('not_goal', len(history))
+            if metrics is not None:
+                metrics.count('not_goal', len(history))
             yield (c, alpha)
 
-        elif HistoryItem(q, s, None) in history:
-            looping_timestep = history.index(HistoryItem(q, s, None))
-
-            l_loop = p
-            for h_item in history[looping_timestep + 1:]:
-                l_loop *= h_item.p
-            if l_loop == 1.:
-                alpha['noter'][len(history)] += 1.
-                logging.info("OR: repeated state")
+        elif history.level(q, s) is not None:
+            looping_timestep = history.level(q, s)
+
+            # The loop is certain iff p and the p of every level after
+            # looping_timestep are all 1.
+            if p == 1. and history.deterministic_after(looping_timestep):
+                i = Alpha.index(NOTER, len(history))
+                assign(alpha, i, alpha.data[i] + 1.)
+                if self.nogoods is not None:
+                    self.nogoods.enter_loop(len(history) + 1, looping_timestep + 1)
+                if tracer is not None:
+                    tracer.emit('noter', len(history))
+                if metrics is not None:
+                    metrics.count('noters', len(history))
             else:
-                alpha['loop'][looping_timestep, len(history)-1] += p
-                logging.info("OR: loop to level %d with prob %.1f", looping_timestep, p)
+                i = Alpha.loop_index(looping_timestep, len(history) - 1)
+                assign(alpha, i, alpha.data[i] + p)
+                if tracer is not None:
+                    tracer.emit('loop', len(history), level=looping_timestep, p=p)
+                if metrics is not None:
+                    metrics.count('loops', len(history))
 
             yield (c, alpha)
+        elif self.approx and self.approx_cut(p, history, alpha):
+            i = Alpha.index(UNKNOWN, len(history))
+            assign(alpha, i, alpha.data[i] + p)
+            if tracer is not None:
+                tracer.emit('cut', len(history), q=q, s=s)
+            if metrics is not None:
+                metrics.count('cuts', len(history))
+            yield (c, alpha)
+        elif self.nogoods is not None and self.nogood_prunes(c, q, s, p, history, alpha):
+            if tracer is not None:
+                tracer.emit('nogood', len(history), q=q, s=s)
+            if metrics is not None:
+                metrics.count('nogood_prunes', len(history))
         else:
-            new_history = history + [HistoryItem(q, s, p)]
+            new_history = history.extended(q, s, p)
             obs = self.env.get_obs(s)
+            nogoods = self.nogoods
+            if nogoods is not None:
+                nogoods.enter(len(new_history), (q, obs))
 
             if (q, obs) in c.transitions:
                 q_next, action = c[q, obs]
 
                 if (action not in self.env.legal_actions(s)) and not (action is A_STOP):
-                    alpha['fail'][len(history) - 1] += p
-                    logging.info("OR: illegal action {} in state {}".format(action, s))
+                    i = Alpha.index(FAIL, len(history) - 1)
+                    assign(alpha, i, alpha.data[i] + p)
+                    if nogoods is not None and len(history):
+                        # it fails at the level of the parent, where the subtree of the parent does not see it
+                        nogoods.settle(len(history), math.inf)
+                    if tracer is not None:
+                        tracer.emit('illegal', len(history), action=action, s=s)
+                    if metrics is not None:
+                        metrics.count('illegal', len(history))
+                    yield (c, alpha)
+                elif self.transpositions is not None and self.transposition_hit(c, q, s, p, new_history, alpha):
+                    if metrics is not None:
+                        metrics.count('transpositions', len(history))
                     yield (c, alpha)
                 else:
                     sl_next = self.extended_next_states(action, s)
                     yield from self.and_step(c, q_next, sl_next, new_history, alpha)
 
             else:
-                transition_list = self.get_mealy_qa_iterator(c, s, obs)
+                transition_list = self.ordering.order(c, q, s, obs, self.get_mealy_qa_iterator(c, s, obs))
+                if trail is not None:
+                    mark = trail.mark()
+                if nogoods is not None:
+                    log_mark = nogoods.mark()
 
                 # non-det branching of q',a
-                for q_next, action in transition_list:
-                    new_cont = copy.deepcopy(c)
-                    new_cont[q, obs] = q_next, action
+                for pos, (q_next, action) in enumerate(transition_list):
+                    if nogoods is not None:
+                        nogoods.truncate(log_mark)
+                    if trail is None:
+                        new_cont = copy.deepcopy(c)
+                        new_cont[q, obs] = q_next, action
+
+                        # new controller -> new alpha dict
+                        new_alpha = copy.deepcopy(alpha)
+                    else:
+                        # roll back whatever the previous branch (and the
+                        # callers it succeeded to) wrote since the mark
+                        trail.undo(mark)
+                        trail.set_transition(c, (q, obs), (q_next, action))
+                        new_cont, new_alpha = c, alpha
+
+                    if tracer is not None:
+                        tracer.emit('add', len(history), q=q, obs=obs, q_next=q_next, action=action, pos=pos)
+
+                    self.num_candidates += 1
+                    if metrics is not None:
+                        metrics.count('or_expansions', len(history))
+                    sl_next = self.extended_next_states(action, s)
 
-                    # new controller -> new alpha dict
-                    new_alpha = copy.deepcopy(alpha)
+                    yield from self.and_step(new_cont, q_next, sl_next, new_history, new_alpha)
+                    self.ordering.exhausted(q, obs, q_next, action)
 
-                    logging.info("OR: Added:   (%s,%s) -> (%s,%s)",
-                                 q, self.env.str_obs(obs),
-                                 q_next, self.env.str_action(action))
+                if trail is not None:
+                    trail.undo(mark)
+                if tracer is not None:
+                    tracer.emit('exhausted', len(history))
 
-                    sl_next = self.extended_next_states(action, s)
+    def iterative_search(self, c, q, sl_next, alpha, forced_choices=(), split_depth=None, on_split=None):
+        """ The first result of iterative_results(...)
 
-                    yield from self.and_step(new_cont, q_next, sl_next, new_history, new_alpha)
+        :raises StopIteration: if the search space is exhausted
+        """
+        return next(self.iterative_results(c, q, sl_next, alpha, forced_choices, split_depth, on_split))
+
+    def iterative_results(self, c, q, sl_next, alpha, forced_choices=(), split_depth=None, on_split=None):
+        """ Runs and_step(c, q, sl_next, History(), alpha) on an explicit stack of OrFrames
+        and yields its results.
+
+        Visits the same nodes in the same order as the generator chain, but
+        a result travels directly to the AND step that decides on it: the
+        nested and_step calls for sl_next[1:], sl_next[2:], ... of one level
+        only pass it up, and cumulate_alpha is idempotent at a fixed level.
+
+        For a given choice of candidates at the branching OR nodes below it,
+        there is a single branching node at each depth (the number of
+        branching nodes on the stack below it), so a sequence of choice
+        indices identifies a subtree of the search:
+        :param forced_choices: the branching node at depth d only tries its
+            candidate forced_choices[d]
+        :param split_depth: a branching node at this depth is not explored;
+            instead on_split is called with the choice indices leading to it
+            and the search continues as if its subtree failed
+        """
+        trail = self.trail
+        tracer = self.tracer
+        stack = []
+        self.forced_choices, self.split_depth, self.on_split = forced_choices, split_depth, on_split
+        self.replayed = None
+
+        # The AND step to be entered: and_step(c, q, sl_next[index:], history, alpha),
+        # whose results go to the AND step of parent
+        history, index, parent = History(), 0, None
+
+        while True:
+            split = False
+            if index == len(sl_next):
+                # AND: all successors handled, report the result upwards
+                if self.nogoods is not None:
+                    self.record_nogood(c, history, alpha)
+                self.cumulate_alpha(alpha, history, trail=trail)
+                frame = parent
+            else:
+                if tracer is not None:
+                    tracer.emit('or', len(history), q=q, s=sl_next[index][0], p=sl_next[index][1])
+                self.extend_alpha(alpha, history)
+
+                frame = OrFrame(c, q, sl_next, index, history, alpha, parent)
+                if stack:
+                    frame.branchings = stack[-1].branchings
+                stack.append(frame)
+                child = self._enter_or_frame(frame, stack)
+                if child is not None:
+                    c, q, sl_next, alpha = child
+                    history, index, parent = frame.new_history, 0, frame
+                    continue
+                split = not frame.terminal
+
+            # (c, alpha) is a result of the OR node `frame`, to be decided on by its AND step,
+            # unless the node was split off or pruned
+            descend = False
+            while frame is not None and not split:
+                likelihoods = self.calc_lambda(alpha, frame.history, trail=trail,
+                                               pending_fail=self.pending_fail(frame.sl_next, frame.index + 1),
+                                               on_noter=self.on_noter)
+                lpc_lower_bound = likelihoods['win']
+                lpc_upper_bound = 1 - likelihoods['fail'] - likelihoods['noter']
+                if likelihoods['unknown']:
+                    lpc_lower_bound, lpc_upper_bound = self.approx_bounds(likelihoods)
+                if self.best is not None and likelihoods['win'] > self.best[0]:
+                    self.record_best(c, likelihoods)
 
-                logging.info("OR: all extensions failed")
+                if lpc_lower_bound >= self.lpc_desired:
+                    if tracer is not None:
+                        tracer.emit('and_success', len(frame.history), win=lpc_lower_bound, upper=lpc_upper_bound)
+                    if self.metrics is not None:
+                        self.metrics.count('and_successes', len(frame.history))
+                    self.cumulate_alpha(alpha, frame.history, trail=trail)
+                    frame = frame.parent
+                elif lpc_upper_bound < self.lpc_desired:
+                    if tracer is not None:
+                        tracer.emit('and_fail', len(frame.history), win=lpc_lower_bound, upper=lpc_upper_bound)
+                    if self.metrics is not None:
+                        self.metrics.count('and_fails', len(frame.history))
+                    break
+                else:
+                    if tracer is not None:
+                        tracer.emit('and_continue', len(frame.history), win=lpc_lower_bound, upper=lpc_upper_bound)
+                    # continue the AND step with the next successor
+                    q, sl_next, history, parent = frame.q, frame.sl_next, frame.history, frame.parent
+                    index = frame.index + 1
+                    if self.and_ordering.dynamic:
+                        sl_next = self.and_ordering.reorder(sl_next, index, lpc_lower_bound, lpc_upper_bound,
+                                                            self.lpc_desired)
+                    descend = True
+                    break
+            else:
+                if frame is None:
+                    # resuming continues like after a failure
+                    yield c, alpha
+
+            if descend:
+                continue
+
+            # Backtrack: resume the most recently suspended OR node
+            while True:
+                if not stack:
+                    return
+                top = stack[-1]
+                child = None if top.terminal else self._next_or_candidate(top)
+                if child is not None:
+                    c, q, sl_next, alpha = child
+                    history, index, parent = top.new_history, 0, top
+                    break
+                stack.pop()
+
+    def _enter_or_frame(self, frame, stack):
+        """ The OR step of the iterative search, up to its first AND step.
+
+        Makes the same updates to alpha as or_step. For a terminal node, returns None;
+        otherwise returns the arguments (c, q, sl_next, alpha) of the AND step below it,
+        or None if the node is split off.
+        """
+        self.num_steps += 1
+        if self.stop_event is not None and not self.num_steps & 0x3ff and self.stop_event.is_set():
+            raise PandorSearchCancelled
+        if self.budget is not None and self.budget.exceeded(self.num_steps):
+            raise PandorBudgetExceeded
+
+        trail = self.trail
+        assign = trail.assign if trail is not None else _assign
+        c, q, s, p, history, alpha = frame.c, frame.q, frame.s, frame.p, frame.history, frame.alpha
+        metrics, tracer = self.metrics, self.tracer
+        if metrics is not None:
+            metrics.count('or_steps', len(history))
+            if not self.num_steps & 0xff:
+                metrics.tick(self.num_steps)
+
+        if s is S_WIN:
+            i = Alpha.index(WIN, len(history))
+            assign(alpha, i, alpha.data[i] + p)
+            if tracer is not None:
+                tracer.emit('goal', len(history))
+            if metrics is not None:
+                metrics.count('goal', len(history))
+            return None
+
+        elif s is S_FAIL:
+            i = Alpha.index(FAIL, len(history))
+            assign(alpha, i, alpha.data[i] + p)
+            if tracer is not None:
+                tracer.emit('not_goal', len(history))
+            if metrics is not None:
+                metrics.count('not_goal', len(history))
+            return None
+
+        elif history.level(q, s) is not None:
+            looping_timestep = history.level(q, s)
+
+            # The loop is certain iff p and the p of every level after
+            # looping_timestep are all 1.
+            if p == 1. and history.deterministic_after(looping_timestep):
+                i = Alpha.index(NOTER, len(history))
+                assign(alpha, i, alpha.data[i] + 1.)
+                if self.nogoods is not None:
+                    self.nogoods.enter_loop(len(history) + 1, looping_timestep + 1)
+                if tracer is not None:
+                    tracer.emit('noter', len(history))
+                if metrics is not None:
+                    metrics.count('noters', len(history))
+            else:
+                i = Alpha.loop_index(looping_timestep, len(history) - 1)
+                assign(alpha, i, alpha.data[i] + p)
+                if tracer is not None:
+                    tracer.emit('loop', len(history), level=looping_timestep, p=p)
+                if metrics is not None:
+                    metrics.count('loops', len(history))
+            return None
+
+        elif self.approx and self.approx_cut(p, history, alpha):
+            i = Alpha.index(UNKNOWN, len(history))
+            assign(alpha, i, alpha.data[i] + p)
+            if tracer is not None:
+                tracer.emit('cut', len(history), q=q, s=s)
+            if metrics is not None:
+                metrics.count('cuts', len(history))
+            return None
+
+        nogoods = self.nogoods
+        if nogoods is not None and self.nogood_prunes(c, q, s, p, history, alpha):
+            if tracer is not None:
+                tracer.emit('nogood', len(history), q=q, s=s)
+            if metrics is not None:
+                metrics.count('nogood_prunes', len(history))
+            frame.terminal = False
+            return None
+
+        frame.new_history = history.extended(q, s, p)
+        frame.obs = obs = self.env.get_obs(s)
+        if nogoods is not None:
+            nogoods.enter(len(frame.new_history), (q, obs))
+
+        if (q, obs) in c.transitions:
+            q_next, action = c[q, obs]
+
+            if (action not in self.env.legal_actions(s)) and not (action is A_STOP):
+                i = Alpha.index(FAIL, len(history) - 1)
+                assign(alpha, i, alpha.data[i] + p)
+                if nogoods is not None and len(history):
+                    # it fails at the level of the parent, where the subtree of the parent does not see it
+                    nogoods.settle(len(history), math.inf)
+                if tracer is not None:
+                    tracer.emit('illegal', len(history), action=action, s=s)
+                if metrics is not None:
+                    metrics.count('illegal', len(history))
+                return None
+            if self.transpositions is not None and self.transposition_hit(c, q, s, p, frame.new_history, alpha):
+                if metrics is not None:
+                    metrics.count('transpositions', len(history))
+                return None
+
+            frame.terminal = False
+            return c, q_next, self.extended_next_states(action, s), alpha
+
+        frame.terminal = False
+        depth = frame.branchings
+        if depth == self.split_depth:
+            self.on_split([f.pos for f in stack if f.candidates is not None])
+            return None
+        if self.forced_choices and depth == len(self.forced_choices) and self.replayed is None:
+            self.replayed = self.num_steps, self.num_candidates
+
+        frame.branchings += 1
+        resuming = self.resuming
+        if resuming is not None and depth < len(resuming.frames):
+            # replaying the search up to the checkpoint: take the candidate it was trying.
+            # The envs test actions by identity, which pickling does not keep.
+            candidates, start, frame.log_mark = resuming.frames[depth]
+            actions = {candidate: candidate for candidate in self.get_mealy_qa_iterator(c, s, obs)}
+            frame.candidates = [actions[candidate] for candidate in candidates]
+        else:
+            if resuming is not None:
+                # this is the node that the checkpoint was saved at
+                self.finish_resume(c)
+                nogoods = self.nogoods
+            elif self.checkpoint_path is not None and time.perf_counter() >= self.next_checkpoint:
+                self.save_checkpoint(c, stack)
+            frame.candidates = self.ordering.order(c, q, s, obs, self.get_mealy_qa_iterator(c, s, obs))
+            start = 0
+        if depth < len(self.forced_choices):
+            frame.candidates = [frame.candidates[self.forced_choices[depth]]]
+        if trail is not None:
+            frame.mark = trail.mark()
+        if nogoods is not None:
+            frame.log_mark = nogoods.mark()
+        return self._next_or_candidate(frame, start)
+
+    def save_checkpoint(self, c, stack):
+        """ Saves the state of the iterative search at the entry of the branching node stack[-1] """
+        frames = [(f.candidates, f.pos, f.log_mark) for f in stack if f.candidates is not None]
+        save_checkpoint(self.checkpoint_path, Checkpoint(
+            CHECKPOINT_VERSION, self.search_params, frames, list(c.transitions.items()),
+            self.num_steps, self.num_candidates, self.ordering if self.ordering.stateful else None, self.nogoods))
+        logging.info("Checkpoint saved at step %d", self.num_steps)
+        self.next_checkpoint = time.perf_counter() + self.checkpoint_interval
+
+    def finish_resume(self, c):
+        """ Restores the state saved in the checkpoint, once the replay reached its node """
+        resuming, self.resuming = self.resuming, None
+        if list(c.transitions.items()) != resuming.transitions:
+            raise ValueError("The search did not replay to the controller of the checkpoint")
+        self.num_steps, self.num_candidates = resuming.num_steps, resuming.num_candidates
+        if resuming.ordering is not None:
+            self.ordering = resuming.ordering
+        self.nogoods = resuming.nogoods
+        logging.info("Resumed at step %d", self.num_steps)
+
+    def parallel_search(self, c, q, sl_next, alpha, workers=None, split_depth=2):
+        """ Runs iterative_search(c, q, sl_next, alpha), farming out subtrees to a process pool
+
+        The subtrees below the branching OR nodes at split_depth are the work
+        units. They are found by a search that does not enter them, then each
+        is searched by a worker. The result is the one found above split_depth,
+        if any, without running the units; otherwise the first result that a
+        unit reports, which stops the other units. When several units succeed,
+        this may be another controller than that of the sequential search.
+
+        num_steps counts the steps of the splitting search, and those of each
+        unit from its node on, up to its end or its stop: a worker replays the
+        path from the root to the node of its unit, which the splitting search
+        took already, and that replay is left out. num_candidates likewise. It
+        is not comparable to the num_steps of the sequential engines: the
+        splitting search visits all of the tree outside the units, and the
+        units run concurrently, whereas the sequential search stops at its
+        first result.
+        """
+        units = []
+        try:
+            result = self.iterative_search(c, q, sl_next, alpha, split_depth=split_depth, on_split=units.append)
+        except StopIteration:
+            result = None
+
+        if units and result is None:
+            backtracking = 'copy' if self.trail is None else 'trail'
+            stop_event = multiprocessing.Event()
+            with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(stop_event,)) as executor:
+                futures = [executor.submit(_search_work_unit, self.env, c.bound, self.lpc_desired,
+                                           backtracking, self.goal_bounds is not None, self.ordering.name,
+                                           self.and_ordering.name,
+                                           self.nogoods.capacity if self.nogoods is not None else 0,
+                                           self.transpositions.capacity if self.transpositions is not None else 0,
+                                           self.approx, self.approx_error, forced_choices)
+                           for forced_choices in units]
+                for future in as_completed(futures):
+                    unit_result = future.result()[0]
+                    if unit_result is not None:
+                        result = unit_result
+                        stop_event.set()
+                        for f in futures:
+                            f.cancel()
+                        break
+            # the pool has waited for the units that were running
+            for future in futures:
+                if not future.cancelled():
+                    _, num_steps, num_candidates = future.result()
+                    self.num_steps += num_steps
+                    self.num_candidates += num_candidates
+
+        if result is None:
+            raise StopIteration
+        self.restore_actions(result[0])
+        return result
+
+    def restore_actions(self, c):
+        """ Replaces the actions of c, unpickled from a worker, by the objects of the env
+
+        The envs test actions by identity, which pickling does not keep. The
+        runs of c from the initial states reach each (q, obs) that c defines,
+        and the action is looked up among the legal actions of the state.
+        """
+        env = self.env
+        restored = {}
+        todo = [(c.init_state, s) for s, _ in env.init_states_p]
+        seen = set(todo)
+        while todo:
+            q, s = todo.pop()
+            key = q, env.get_obs(s)
+            if key not in c.transitions:
+                continue
+            q_next, action = c.transitions[key]
+            if key not in restored:
+                actions = {a: a for a in env.legal_actions(s)}
+                actions[A_STOP] = A_STOP
+                restored[key] = actions.get(action, action)
+            action = restored[key]
+            if action is A_STOP or action not in env.legal_actions(s):
+                continue
+            for s_next in env.next_states(s, action):
+                if (q_next, s_next) not in seen:
+                    seen.add((q_next, s_next))
+                    todo.append((q_next, s_next))
+        for key, action in restored.items():
+            c.transitions[key] = c.transitions[key][0], action
+
+    def _next_or_candidate(self, frame, start=None):
+        """ Continues a non-terminal OR node after the AND step below it is exhausted.
+
+        Returns the arguments (c, q, sl_next, alpha) of the next AND step to try,
+        or None if the node is exhausted.
+        :param start: position of the first candidate to try, when entering the node
+        """
+        trail = self.trail
+        if frame.candidates is None:
+            # the transition was already defined: there was a single AND step
+            return None
+
+        if start is None:
+            self.ordering.exhausted(frame.q, frame.obs, *frame.candidates[frame.pos])
+            frame.pos += 1
+        else:
+            frame.pos = start
+        if frame.pos == len(frame.candidates):
+            if trail is not None:
+                trail.undo(frame.mark)
+            if self.tracer is not None:
+                self.tracer.emit('exhausted', len(frame.history))
+            return None
+
+        q_next, action = frame.candidates[frame.pos]
+        q, obs = frame.q, frame.obs
+        self.num_candidates += 1
+        if self.metrics is not None:
+            self.metrics.count('or_expansions', len(frame.history))
+        if self.nogoods is not None:
+            self.nogoods.truncate(frame.log_mark)
+        if trail is None:
+            new_cont = copy.deepcopy(frame.c)
+            new_cont[q, obs] = q_next, action
+            new_alpha = copy.deepcopy(frame.alpha)
+        else:
+            trail.undo(frame.mark)
+            trail.set_transition(frame.c, (q, obs), (q_next, action))
+            new_cont, new_alpha = frame.c, frame.alpha
+
+        if self.tracer is not None:
+            self.tracer.emit('add', len(frame.history), q=q, obs=obs, q_next=q_next, action=action,
+                             pos=frame.pos)
+
+        return new_cont, q_next, self.extended_next_states(action, frame.s), new_alpha
 
     def extended_next_states(self, action, s):
         if action is A_STOP:
@@ -204,34 +1097,126 @@ class PAndOrPlanner:
             else:
                 sl_next = [(S_FAIL, 1.0)]
         else:
-            sl_next = sorted(self.env.next_states_p(s, action), key=lambda sp: sp[1], reverse=True)
+            sl_next = self.and_ordering.order(self.env.next_states_p_sorted(s, action))
 
         return sl_next
 
+    def approx_cut(self, p, history, alpha):
+        """ Whether the approximate search cuts off an OR node of probability p below history
+
+        The product of the p along the history is not the probability of the
+        runs that reach the node: each level that the runs loop back to (a
+        nonzero loop[k, l] of alpha) multiplies it by 1 / (1 - its loop
+        likelihood), so that it shrinks along a corridor of noisy loops that
+        the runs cross for sure. The node is cut off when the product of p and
+        the p of the levels after the deepest such level is below approx.
+        """
+        n = len(history)
+        path_p = p * history.cum_p(-1) if n else p
+        if path_p >= self.approx:
+            return False
+        data, loop_end = alpha.data, alpha.loop_end
+        for k in range(n - 1, -1, -1):
+            # loop[k, l] is zero for l > loop_end[k], and not written yet for l >= n
+            end_k = min(loop_end[k], n - 1)
+            if end_k >= k and data[alpha.loop_row(k, end_k + 1)].any():
+                return path_p / history.cum_p(k) < self.approx
+        return True
+
+    def pending_fail(self, sl_next, start):
+        """ A lower bound of the likelihood that the successors sl_next[start:] do not reach the goal """
+        if self.goal_bounds is None:
+            return 0.
+        return sum(p * (1. - self.goal_bounds.get(s, 1.)) for s, p in sl_next[start:])
+
+    def nogood_prunes(self, c, q, s, p, history, alpha):
+        """ Whether the OR node (q, s) cannot reach lpc_desired, given the nogoods of c """
+        g = self.nogoods.lookup(c, q, s)
+        if g == 0.:
+            return False
+        likelihoods = self.calc_lambda(alpha, history, trail=self.trail, pending_fail=p * g, on_noter=self.on_noter)
+        if 1 - likelihoods['fail'] - likelihoods['noter'] < self.lpc_desired:
+            self.nogoods.prunes += 1
+            return True
+        return False
+
+    def approx_bounds(self, likelihoods):
+        """ The bounds of the LGT that the AND steps of the approximate search compare
+        to lpc_desired, for likelihoods with some unknown runs
+
+        While the unknown likelihood is at most approx_error, the unknown runs
+        count as reaching the goal. Once it exceeds approx_error (it never
+        decreases as the search goes deeper), they count as not reaching it.
+        """
+        win, unknown = likelihoods['win'], likelihoods['unknown']
+        upper = 1 - likelihoods['fail'] - likelihoods['noter']
+        if unknown <= self.approx_error:
+            return win + unknown, upper
+        return win, upper - unknown
+
+    def transposition_hit(self, c, q, s, p, new_history, alpha):
+        """ Adds the likelihoods of the subtree of the OR node (q, s) to alpha, if
+        the transposition table knows them """
+        found = self.transpositions.lookup(c, q, s)
+        if found is None:
+            return False
+
+        used, likelihoods = found
+        assign = self.trail.assign if self.trail is not None else _assign
+        level = len(new_history) - 1
+        for x, likelihood in zip((WIN, FAIL, NOTER), likelihoods):
+            if likelihood:
+                i = Alpha.index(x, level)
+                assign(alpha, i, alpha.data[i] + p * likelihood)
+        if self.nogoods is not None:
+            # the subtree would have used these transitions, and they only matter if it fails
+            reach = None if likelihoods[1] or likelihoods[2] else -1
+            self.nogoods.settle(len(new_history), reach)
+            for key, _ in used:
+                self.nogoods.enter(len(new_history) + 1, key, reach)
+        if self.tracer is not None:
+            self.tracer.emit('transposition', len(new_history) - 1, q=q, s=s)
+        return True
+
+    def on_noter(self, k):
+        """ Called by calc_lambda when the runs of history[k] turn out to loop back to it for sure """
+        if self.nogoods is not None:
+            # the levels of the log are one more than those of the history
+            self.nogoods.loops_forever(k + 1)
+
+    def record_nogood(self, c, history, alpha):
+        """ Stores the failure likelihood of the finished subtree of history[-1] """
+        if len(history) == 0:
+            return
+        n = len(history) - 1
+        data = alpha.data
+        fail, noter = data[Alpha.index(FAIL, n+1)], data[Alpha.index(NOTER, n+1)]
+        if fail > 0. or noter > 0.:
+            scale = 1 - data[Alpha.loop_index(n, n)]
+            self.nogoods.record(c, len(history), history[-1].q, history[-1].s, fail / scale, noter / scale)
+        else:
+            # the levels of the log are one more than those of the history
+            loops = data[Alpha.loop_column(n)].nonzero()[0]
+            self.nogoods.settle(len(history), int(loops[-1]) + 1 if loops.size else -1)
+
     @staticmethod
     def extend_alpha(alpha, history):
         """NB. This modifies alpha in place"""
-
-        if len(alpha['win']) < len(history) + 1:
-            # extend the size of alpha vectors
-            for x in 'win', 'fail', 'noter':
-                alpha[x] += [0.] * NEW_ROWS
-            n_old, _ = alpha['loop'].shape
-            alpha_loop_new = np.zeros((n_old + NEW_ROWS, n_old + NEW_ROWS))
-            alpha_loop_new[:n_old, :n_old] = alpha['loop']
-            alpha['loop'] = alpha_loop_new
-        else:
-            pass
+        alpha.ensure_levels(len(history) + 1)
 
     @staticmethod
-    def cumulate_alpha(alpha, history):
+    def cumulate_alpha(alpha, history, trail=None):
         """NB modifies alpha in place
 
-        Furthermore, this function is idempotent: calling it twice has the same effect as calling it once."""
+        Furthermore, this function is idempotent: calling it twice has the same effect as calling it once.
+
+        :param trail: if given, the modifications are recorded on it"""
 
-        assert not (len(alpha['win']) < len(history) + 1)
+        assert not (alpha.levels < len(history) + 1)
 
-        if history == []:
+        assign = trail.assign if trail is not None else _assign
+
+        if len(history) == 0:
             # nothing to do.
             return alpha
 
@@ -239,74 +1224,158 @@ class PAndOrPlanner:
         n = len(history) - 1
 
         p_this = history[-1].p
+        data = alpha.data
+        i_nn = Alpha.loop_index(n, n)
+        loop_nn = data[i_nn]
+
+        # Only the nonzero entries of level n+1 change anything, so only they
+        # are written (and recorded on the trail): adding 0. leaves a value as it is
+        for x in WIN, FAIL, NOTER, UNKNOWN:
+            i_next = Alpha.index(x, n+1)
+            if data[i_next]:
+                i = Alpha.index(x, n)
+                assign(alpha, i, data[i] + p_this * data[i_next] / (1 - loop_nn))
+                assign(alpha, i_next, 0.)
+
+        if n > 0:
+            # loop[k, n-1] += ... loop[k, n] for the k < n with loop[k, n] != 0
+            col_next = Alpha.loop_column(n, stop=n)
+            rows = np.flatnonzero(data[col_next])
+            if rows.size:
+                i, i_next = Alpha.loop_index(0, n-1) + rows, col_next.start + rows
+                assign(alpha, i, data[i] + p_this * data[i_next] / (1 - loop_nn))
+                assign(alpha, i_next, 0.)
+
+        if loop_nn:
+            assign(alpha, i_nn, 0.)
+
+        for i in alpha.loop_row(len(history)), Alpha.loop_column(len(history)):
+            nonzero = np.flatnonzero(data[i])
+            if nonzero.size:
+                assign(alpha, i[nonzero] if isinstance(i, np.ndarray) else i.start + nonzero, 0.)
 
-        for x in 'win', 'fail', 'noter':
-            alpha[x][n] += p_this * alpha[x][n+1] / (1 - alpha['loop'][n, n])
-            alpha[x][n+1] = 0.
-
-        for k in range(n):
-            alpha['loop'][k, n-1] += p_this * alpha['loop'][k, n] / (1 - alpha['loop'][n, n])
-            alpha['loop'][k, n] = 0.
+        return alpha
 
-        alpha['loop'][n, n] = 0.
+    @staticmethod
+    def calc_lambda(alpha, history, epsilon=1e-6, trail=None, pending_fail=0., on_noter=None):
+        """NB. Modifies alpha in place, but in a way that keeps lambda unchanged
 
-        alpha['loop'][len(history), :] = 0.
-        alpha['loop'][:, len(history)] = 0.
+        likelihoods_loop[k] folds row k of alpha's loop matrix from its last nonzero
+        level down to k, with the factor p[l] / (1 - likelihoods_loop[l]) of each level l
+        it crosses: the same floating point operations, in the same order, as the
+        column-by-column definition. A row that alpha.set did not write since the
+        previous call, and whose factors did not change, is reused from
+        alpha.lambda_cache, so that a call costs O(depth) plus the rows it recomputes.
 
-        return alpha
+        :param trail: if given, the modifications are recorded on it
+        :param pending_fail: likelihood of failing added to the last level, as if it were in alpha
+        :param on_noter: if given, called with k when the runs of history[k] turn out to loop back to it for sure"""
+        assign = trail.assign if trail is not None else _assign
 
-    @staticmethod
-    def calc_lambda(alpha, history, epsilon=1e-6):
-        """NB. Modifies alpha in place, but in a way that keeps lambda unchanged"""
         # history[0] .. history[n]
         n = len(history) - 1
-        likelihoods_loop = np.empty(n+1)
-        likelihoods_loop[:] = np.nan
-
-        likelihoods = {}
-        for x in 'win', 'fail', 'noter':
-            likelihoods[x] = alpha[x][n+1]
+        data = alpha.data
+
+        # values[l]: win[l], fail[l], noter[l], unknown[l]
+        values = data[Alpha.kind_index[:n + 2]].tolist()
+        win, fail, noter, unknown = values[n + 1]
+        fail += pending_fail
+        if n < 0:
+            return {'win': win, 'fail': fail, 'noter': noter, 'unknown': unknown}
+
+        p = [h_item.p for h_item in history]
+        cache, dirty, loop_end = alpha.lambda_cache, alpha.dirty, alpha.loop_end
+        cached = len(cache.end) if cache is not None else 0
+        likelihoods_loop = [0.] * (n + 1)
+        end = [-1] * (n + 1)
+        folded = [0.] * (n + 1)
+        # the lowest level above k whose factor differs from the cached one
+        changed = n + 1
+        fixed_noter = False
 
         for k in range(n, -1, -1):
-            p_k = history[k].p
-
-            likelihoods_loop[k] = alpha['loop'][k, n]
-            for m in range(n-1, k-1, -1):  # m = n-1 .. k
-                likelihoods_loop[k] *= history[m + 1].p / (1 - likelihoods_loop[m + 1])
-                likelihoods_loop[k] += alpha['loop'][k, m]
-
-            if likelihoods_loop[k] > 1. - epsilon:
+            p_k = p[k]
+
+            end_k = loop_end[k]
+            if end_k > n:
+                end_k = n
+            if end_k < k:
+                loop_k = 0.
+            elif k < cached and k not in dirty and cache.end[k] == end_k and changed > end_k:
+                loop_k = cache.likelihoods_loop[k]
+            else:
+                row = data[alpha.loop_row(k, end_k + 1)].tolist()
+                while row and not row[-1]:
+                    row.pop()
+                end_k = k + len(row) - 1
+                if loop_end[k] <= n:
+                    loop_end[k] = end_k
+                loop_k = row[-1] if row else 0.
+                for l in range(end_k, k, -1):
+                    loop_k = loop_k * folded[l] + row[l - k - 1]
+
+            if loop_k > 1. - epsilon:
                 # in this case, the whole tree below k loops back to history[k], so
-                # for every key in 'win', 'fail', 'noter', likelihoods[key] == 0.
+                # for every key in 'win', 'fail', 'noter', 'unknown', likelihoods[key] == 0.
                 # And as likelihoods_loop[k] ~= 1 here,
                 #  avoid division by zero.
 
-                likelihoods_loop[k] = 0.
-
                 # fix it for future calls too:
-                alpha['noter'][k] += p_k
-                alpha['loop'][k:n + 1, k:n + 1] = 0.
-                assert np.all(alpha['loop'][:k, k:n + 1] == 0.)
-
-                for key in 'win', 'fail', 'noter':
-                    assert likelihoods[key] == 0.
-                    likelihoods[key] = alpha[key][k]
+                i = Alpha.index(NOTER, k)
+                assign(alpha, i, data[i] + p_k)
+                # loop[k:n + 1, k:n + 1] = 0.
+                rows = Alpha.loop_rows[base(k):base(n + 1)]
+                zero = base(k) + np.flatnonzero(rows >= k)
+                zero = zero[data[zero] != 0.]
+                if zero.size:
+                    assign(alpha, zero, 0.)
+                assert not np.any(data[base(k) + np.flatnonzero((0 <= rows) & (rows < k))])
+
+                # (a pending_fail below k is dropped with the rest of the subtree)
+                assert not (win or fail or noter or unknown) or pending_fail > 0.
+                win, fail, noter, unknown = data[Alpha.kind_index[k]].tolist()
+                # rows k.. are zero now, and the cache does not know it
+                loop_k = 0.
+                fixed_noter = True
+                if on_noter is not None:
+                    on_noter(k)
 
             else:
-                for key in 'win', 'fail', 'noter':
-                    likelihoods[key] = alpha[key][k] + \
-                                        p_k * likelihoods[key] / (1. - likelihoods_loop[k])
-
-            assert np.all(0. <= likelihoods_loop[k])
-            assert np.all(likelihoods_loop[k] <= 1.)
-
-        for key in 'win', 'noter':
-            assert 0. <= likelihoods[key] <= 1.
-        assert 0. <= likelihoods['fail']
+                win_k, fail_k, noter_k, unknown_k = values[k]
+                win = win_k + p_k * win / (1. - loop_k)
+                fail = fail_k + p_k * fail / (1. - loop_k)
+                noter = noter_k + p_k * noter / (1. - loop_k)
+                unknown = unknown_k + p_k * unknown / (1. - loop_k)
+
+            assert 0. <= loop_k <= 1.
+
+            likelihoods_loop[k], end[k] = loop_k, end_k
+            folded[k] = p_k / (1 - loop_k)
+            if k >= cached or folded[k] != cache.folded[k]:
+                changed = k
+
+        alpha.lambda_cache = _LambdaCache(likelihoods_loop, end, folded) if not fixed_noter else None
+        dirty.clear()
+
+        likelihoods = {'win': win, 'fail': fail, 'noter': noter, 'unknown': unknown}
+        for key in 'win', 'noter', 'unknown':
+            # the divisions by 1 - loop_k may round a likelihood of 1 a few ulps over it
+            assert -epsilon <= likelihoods[key] <= 1. + epsilon
+            likelihoods[key] = min(max(likelihoods[key], 0.), 1.)
+        assert -epsilon <= likelihoods['fail']
+        likelihoods['fail'] = max(likelihoods['fail'], 0.)
 
         return likelihoods
 
     def get_mealy_qa_iterator(self, c, s, obs):
+        """ The (q_next, action) candidates of a new transition of c
+
+        q_next is at most c.num_states, so states are numbered in the order the
+        search first uses them. As the search visits the OR nodes in an order
+        that only depends on the transitions defined so far, this already rules
+        out exploring two controllers that are equal up to renaming their states
+        (see MealyController.canonical_form).
+        """
         if self.env.is_goal_state(s):
             return [(0, A_STOP)]
 
@@ -317,6 +1386,37 @@ class PAndOrPlanner:
                                  for action in legal_acts]
 
 
+# The stop event of a worker process of PAndOrPlanner.parallel_search
+_worker_stop_event = None
+
+
+def _init_worker(stop_event):
+    global _worker_stop_event
+    _worker_stop_event = stop_event
+
+
+def _search_work_unit(env, states_bound, lpc_desired, backtracking, heuristic, ordering, and_ordering, nogoods,
+                      transpositions, approx, approx_error, forced_choices):
+    """ Searches one work unit of PAndOrPlanner.parallel_search in a worker process
+
+    :returns: (controller, alpha) or None, and the numbers of steps and
+        candidates taken from the node of the unit on, i.e. without
+        replaying the path from the root that the splitting search took already
+    """
+    planner = PAndOrPlanner(env)
+    planner.stop_event = _worker_stop_event
+    cont, alpha = planner.init_search(states_bound, lpc_desired, backtracking, heuristic, ordering, nogoods,
+                                      transpositions, approx=approx, approx_error=approx_error,
+                                      and_ordering=and_ordering)
+    sl_init = planner.and_ordering.order(env.init_states_p)
+    try:
+        result = planner.iterative_search(cont, cont.init_state, sl_init, alpha, forced_choices=forced_choices)
+    except (StopIteration, PandorSearchCancelled):
+        result = None
+    replayed_steps, replayed_candidates = planner.replayed or (planner.num_steps, planner.num_candidates)
+    return result, planner.num_steps - replayed_steps, planner.num_candidates - replayed_candidates
+
+
 def parse_args():
     argparser = argparse.ArgumentParser()
     argparser.add_argument('--env',
@@ -328,6 +1428,13 @@ def parse_args():
     argparser.add_argument('--max-states',
                            type=int,
                            help='Maximum number of controller states')
+    argparser.add_argument('--iterative',
+                           action='store_true',
+                           help='Find the smallest controller, trying the bounds --min-states to --max-states in turn')
+    argparser.add_argument('--min-states',
+                           type=int,
+                           default=None,
+                           help='First bound tried by --iterative (default: 1); implies --iterative')
     argparser.add_argument('--lgt-desired',
                            type=float,
                            default=0.9999,
@@ -338,6 +1445,123 @@ def parse_args():
     argparser.add_argument('--log-info',
                            action='store_true',
                            help='Print almost all logging messages (level INFO and above)')
+    argparser.add_argument('--backtracking',
+                           choices=['copy', 'trail'],
+                           default='copy',
+                           help='Deep-copy the controller at every OR branch, or modify it in place and undo on backtrack')
+    argparser.add_argument('--compile',
+                           action='store_true',
+                           help='Compile the environment to integer-indexed tables before the search')
+    argparser.add_argument('--cache-env',
+                           type=int,
+                           default=None,
+                           metavar='SIZE',
+                           help='Memoize the environment in LRU caches of SIZE entries each (see memo.py)')
+    argparser.add_argument('--engine',
+                           choices=['recursive', 'iterative', 'parallel'],
+                           default='recursive',
+                           help='Run the search as recursive generators, on an explicit stack, '
+                                'or on an explicit stack in a process pool')
+    argparser.add_argument('--workers',
+                           type=int,
+                           default=None,
+                           help='Number of worker processes for --engine parallel (default: number of CPUs)')
+    argparser.add_argument('--split-depth',
+                           type=int,
+                           default=2,
+                           help='Number of branching OR nodes that identify a work unit for --engine parallel')
+    argparser.add_argument('--heuristic',
+                           action='store_true',
+                           help='Prune with upper bounds of the goal likelihood of the states not yet simulated')
+    argparser.add_argument('--ordering',
+                           choices=list(ORDERINGS),
+                           default='default',
+                           help='Order in which OR nodes try the (q_next, action) candidates')
+    argparser.add_argument('--and-ordering',
+                           choices=list(SUCCESSOR_ORDERINGS),
+                           default='likely',
+                           help='Order in which AND steps simulate the successor states')
+    argparser.add_argument('--nogoods',
+                           type=int,
+                           default=0,
+                           metavar='CAPACITY',
+                           help='Learn failures of finished subtrees, keeping at most CAPACITY of them')
+    argparser.add_argument('--transpositions',
+                           type=int,
+                           default=0,
+                           metavar='CAPACITY',
+                           help='Reuse the likelihoods of the subtrees the controller determines, keeping at most '
+                                'CAPACITY of them')
+    argparser.add_argument('--time-budget',
+                           type=float,
+                           default=None,
+                           metavar='SECONDS',
+                           help='Anytime search: stop after SECONDS and print the best controller seen')
+    argparser.add_argument('--step-budget',
+                           type=int,
+                           default=None,
+                           metavar='STEPS',
+                           help='Anytime search: stop after STEPS steps and print the best controller seen')
+    argparser.add_argument('--tighten',
+                           type=float,
+                           default=None,
+                           metavar='MARGIN',
+                           help='Anytime search: after a controller is found, search for one with MARGIN higher LGT')
+    argparser.add_argument('--approx',
+                           type=float,
+                           default=0.,
+                           metavar='P',
+                           help='Do not simulate the branches of path probability below P, and print the certified '
+                                'LGT interval of the controller found')
+    argparser.add_argument('--approx-error',
+                           type=float,
+                           default=0.,
+                           metavar='E',
+                           help='With --approx, accept a controller whose LGT is certainly at least '
+                                '--lgt-desired - E')
+    argparser.add_argument('--enumerate',
+                           type=int,
+                           default=None,
+                           metavar='LIMIT',
+                           help='Print up to LIMIT of the controllers with LGT >= --lgt-desired that the search '
+                                'reaches, 0 for all of them')
+    argparser.add_argument('--checkpoint',
+                           default=None,
+                           metavar='PATH',
+                           help='Save the frontier of the search to PATH periodically (iterative engine)')
+    argparser.add_argument('--checkpoint-interval',
+                           type=float,
+                           default=60.,
+                           metavar='SECONDS',
+                           help='Seconds between checkpoints')
+    argparser.add_argument('--resume',
+                           action='store_true',
+                           help='Continue the search saved in the --checkpoint file')
+    argparser.add_argument('--metrics',
+                           default=None,
+                           metavar='PATH',
+                           help='Write counters of the search per history depth and its phase times to PATH as JSON')
+    argparser.add_argument('--metrics-sample',
+                           default=None,
+                           metavar='PATH',
+                           help='Append the totals of the counters to PATH as JSON lines during the search')
+    argparser.add_argument('--metrics-interval',
+                           type=float,
+                           default=10.,
+                           metavar='SECONDS',
+                           help='Seconds between the samples of --metrics-sample')
+    argparser.add_argument('--trace',
+                           default=None,
+                           metavar='PATH',
+                           help='Write the events of the search to PATH as JSON lines (see tracing.py)')
+    argparser.add_argument('--evaluate',
+                           action='store_true',
+                           help='Print the exact likelihoods of the controller found, solving its Markov chain')
+    argparser.add_argument('--simulate',
+                           type=int,
+                           default=0,
+                           metavar='EPISODES',
+                           help='Print Monte Carlo estimates of the likelihoods of the controller found')
     argparser.add_argument('--no-timeit',
                            action='store_true',
                            help="Don't time the execution")
@@ -349,42 +1573,126 @@ def parse_args():
     argparser.add_argument('env_args', type=int, nargs='*')
 
     args = argparser.parse_args()
+    if args.resume and args.checkpoint is None:
+        argparser.error('--resume needs --checkpoint')
+    if args.compile and args.cache_env is not None:
+        argparser.error('--compile already tabulates the environment, --cache-env is not needed')
 
     env_cls = getattr(environments, args.env)
     env = env_cls(*args.env_args)
+    if args.compile:
+        env = compile_env(env)
+    if args.cache_env is not None:
+        env = CachedEnv(env, args.cache_env)
 
     return args, env
 
 
 def main(args, env):
     planner = PAndOrPlanner(env)
+    if args.metrics is not None or args.metrics_sample is not None:
+        planner.metrics = SearchMetrics(args.metrics_sample, args.metrics_interval)
+    if args.trace is not None:
+        planner.trace = SearchTrace(env, args.trace, log=logging.getLogger().isEnabledFor(logging.INFO))
+
+    options = dict(backtracking=args.backtracking,
+                   engine=args.engine,
+                   workers=args.workers,
+                   split_depth=args.split_depth,
+                   heuristic=args.heuristic,
+                   ordering=args.ordering,
+                   and_ordering=args.and_ordering,
+                   nogoods=args.nogoods,
+                   transpositions=args.transpositions,
+                   approx=args.approx,
+                   approx_error=args.approx_error)
+    iterative = args.iterative or args.min_states is not None
+    anytime = args.time_budget is not None or args.step_budget is not None or args.tighten is not None
 
     try:
-        good_cont, good_alpha = planner.synth_plan(args.max_states,
-                                                   lpc_desired=args.lgt_desired)
-
-        time.sleep(PRINT_WAIT_SECONDS)  # Wait for mesages of logging module
-        for (q, o), (q_next, a) in good_cont.transitions.items():
-            print("({},{}) → ({},{})".format(q, env.str_obs(o), q_next, env.str_action(a)))
+        if args.enumerate is not None:
+            enumerate_options = {key: value for key, value in options.items() if key not in ('workers', 'split_depth')}
+            num_found = 0
+            for num_found, (cont, likelihoods) in enumerate(
+                    planner.iter_plans(args.max_states, args.lgt_desired, limit=args.enumerate or None,
+                                       **enumerate_options), 1):
+                print("Controller {}: LGT >= {}".format(num_found, likelihoods['win']))
+                for (q, o), (q_next, a) in cont.transitions.items():
+                    print("({},{}) → ({},{})".format(q, env.str_obs(o), q_next, env.str_action(a)))
+            print("Controllers found: {}".format(num_found))
+            if not num_found:
+                raise PandorControllerNotFound
+            good_cont = None
+        elif anytime:
+            anytime_options = {key: value for key, value in options.items() if key not in ('workers', 'split_depth')}
+            good_cont, interval = planner.synth_anytime(args.max_states, args.lgt_desired,
+                                                        seconds=args.time_budget,
+                                                        max_steps=args.step_budget,
+                                                        tighten=args.tighten,
+                                                        **anytime_options)
+            time.sleep(PRINT_WAIT_SECONDS)  # Wait for mesages of logging module
+            print("LGT of the controller (and of any completion of it): [{}, {}]".format(*interval))
+        elif iterative:
+            try:
+                good_cont, good_alpha, bound = planner.synth_smallest(args.min_states or 1, args.max_states,
+                                                                      args.lgt_desired, **options)
+            finally:
+                time.sleep(PRINT_WAIT_SECONDS)  # Wait for mesages of logging module
+                for stats in planner.bound_stats:
+                    print("Bound {bound}: {result}, {num_steps} steps, {seconds:f} seconds".format(
+                        result='found' if stats['found'] else 'not found', **stats))
+            print("Smallest bound: {}".format(bound))
+        else:
+            good_cont, good_alpha = planner.synth_plan(args.max_states, lpc_desired=args.lgt_desired,
+                                                       checkpoint=args.checkpoint,
+                                                       checkpoint_interval=args.checkpoint_interval,
+                                                       resume=args.resume, **options)
+            time.sleep(PRINT_WAIT_SECONDS)  # Wait for mesages of logging module
+
+        # the enumeration printed its controllers already
+        if good_cont is not None:
+            for (q, o), (q_next, a) in good_cont.transitions.items():
+                print("({},{}) → ({},{})".format(q, env.str_obs(o), q_next, env.str_action(a)))
+
+            if args.approx and not anytime:
+                print("LGT of the controller: [{}, {}], of which unknown: {}".format(
+                    good_alpha['win'], 1 - good_alpha['fail'] - good_alpha['noter'], good_alpha['unknown']))
+            if args.evaluate:
+                print("Exact likelihoods: {}".format(evaluate_controller(good_cont, env)))
+            if args.simulate:
+                stats = simulate_controller(good_cont, env, episodes=args.simulate)
+                print("Simulated likelihoods in {} episodes: win {}, fail {}, timeout {}".format(
+                    args.simulate, stats['win'], stats['fail'], stats['timeout']))
 
     except PandorControllerNotFound:
-        time.sleep(PRINT_WAIT_SECONDS)  # Wait for mesages of logging module
+        if not iterative:
+            time.sleep(PRINT_WAIT_SECONDS)  # Wait for mesages of logging module
         print("No controller found")
 
-    print("Number of steps taken: {}".format(planner.num_steps))
+    if iterative:
+        print("Number of steps taken: {}".format(sum(stats['num_steps'] for stats in planner.bound_stats)))
+    else:
+        print("Number of steps taken: {}".format(planner.num_steps))
+    print("Number of candidates tried: {}".format(planner.num_candidates))
+    if planner.nogoods is not None:
+        print("Nogoods: {}".format(planner.nogoods.stats()))
+    if planner.transpositions is not None:
+        print("Transpositions: {}".format(planner.transpositions.stats()))
+    if isinstance(env, CachedEnv):
+        print("Environment caches: {}".format(env.stats()))
+    if args.metrics is not None:
+        planner.metrics.save(args.metrics)
+    if planner.trace is not None:
+        planner.trace.close()
 
 
 if __name__ == '__main__':
     args, env = parse_args()
 
     if args.verbose:
-        v = True
         logging.basicConfig(level=logging.DEBUG)
     elif args.log_info:
-        v = False
         logging.basicConfig(level=logging.INFO)
-    else:
-        v = False
 
     logging.info(f'Command-line options:\n{args}\n')
 
@@ -0,0 +1,87 @@
+"""
+Monte Carlo estimates of the behaviour of a controller in an environment
+
+All episodes are run at once: the current (q, s) of every episode is kept
+in numpy arrays, and every step samples the successors of all running
+episodes from the CSR tables of a TabularEnv.
+"""
+
+import numpy as np
+
+from evaluate import controller_tables, ACT_STOP
+from tabular import TabularEnv, compile_env
+
+
+def simulate_controller(c, env, episodes=10000, max_steps=1000, seed=None):
+    """ Runs `episodes` episodes of c in env
+
+    An episode ends in 'win' if the controller stops in a goal state, in
+    'fail' if it stops elsewhere, does an illegal action, or has no
+    transition for (q, obs), and in 'timeout' if it is still running after
+    max_steps actions (the estimate of 'noter').
+
+    :param env: a NoisyEnv; it is compiled with compile_env() unless it is a TabularEnv
+    :param seed: seed of the numpy random generator
+    :returns: dict with the rates of 'win', 'fail' and 'timeout', and
+        'steps': {'win': ..., 'fail': ...}, the histograms of the number of
+        actions (not counting the stop) of the episodes that ended, as
+        arrays indexed by the number of actions
+    """
+    if not isinstance(env, TabularEnv):
+        env = compile_env(env)
+    rng = np.random.default_rng(seed)
+
+    next_q, act = controller_tables(c, env)
+    n_a = env.num_actions
+    # the successors of a row are sampled by bisecting the global cumulative sum
+    cum_p = np.cumsum(env.trans_p)
+    row_start_p = np.concatenate(([0.], cum_p))[env.trans_ptr[:-1]]
+
+    init = np.array([s_0 for s_0, _ in env.init_states_p], dtype=np.intp)
+    init_p = np.array([p_0 for _, p_0 in env.init_states_p])
+    s = init[rng.choice(len(init), size=episodes, p=init_p / init_p.sum())]
+    q = np.zeros(episodes, dtype=np.intp)
+    # indices of the running episodes
+    running = np.arange(episodes)
+
+    outcome = np.full(episodes, -1, dtype=np.int8)  # 0: win, 1: fail, -1: timeout
+    steps = np.zeros(episodes, dtype=np.intp)
+
+    for step in range(max_steps + 1):
+        if len(running) == 0:
+            break
+
+        o = env.obs[s]
+        a = act[q, o]
+        stop = a == ACT_STOP
+        legal = np.zeros(len(running), dtype=bool)
+        moving = (0 <= a) & (a < n_a)
+        legal[moving] = env.legal[s[moving], a[moving]]
+
+        win = stop & env.goal[s]
+        ended = ~legal
+        outcome[running[win]] = 0
+        outcome[running[ended & ~win]] = 1
+        steps[running[ended]] = step
+
+        if step == max_steps:
+            break
+
+        q, s, a, running = next_q[q[legal], o[legal]], s[legal], a[legal], running[legal]
+
+        row = s * n_a + a
+        target = row_start_p[row] + rng.random(len(running)) * (cum_p[env.trans_ptr[row + 1] - 1] - row_start_p[row])
+        entry = np.searchsorted(cum_p, target, side='right')
+        # rounding can put the target on a neighbouring row
+        entry = np.clip(entry, env.trans_ptr[row], env.trans_ptr[row + 1] - 1)
+        s = env.trans_state[entry]
+
+    return {
+        'win': float(np.mean(outcome == 0)),
+        'fail': float(np.mean(outcome == 1)),
+        'timeout': float(np.mean(outcome == -1)),
+        'steps': {
+            'win': np.bincount(steps[outcome == 0], minlength=1),
+            'fail': np.bincount(steps[outcome == 1], minlength=1),
+        },
+    }
@@ -0,0 +1,146 @@
+from collections import deque
+
+import numpy as np
+
+from environments import NoisyEnv
+
+
+class TabularEnv(NoisyEnv):
+    """ A NoisyEnv compiled to integer ids by compile_env()
+
+    States, observations and actions are ids 0, 1, 2, ... assigned in the
+    order they are first met. The tables are numpy arrays:
+     - obs[s]: observation id of state s
+     - goal[s]: whether s is a goal state
+     - legal[s, a]: whether action a is legal in s
+     - legal_ptr, legal_act: CSR lists of the legal actions of each state,
+       in the order of the original env's legal_actions()
+     - trans_ptr, trans_state, trans_p: CSR successor distributions of the
+       (s, a) pairs, row s * num_actions + a, sorted by decreasing
+       probability as PAndOrPlanner.extended_next_states would sort them
+
+    The NoisyEnv methods answer from Python lists precomputed from these
+    tables, so PAndOrPlanner can run on a TabularEnv like on any other
+    environment; str_state() etc. translate back to the original env.
+    """
+
+    def __init__(self, env, states, observations, actions, init_states_p,
+                 obs, goal, legal_lists, successors):
+        self.env = env
+        self.states = states
+        self.observations = observations
+        self.actions = actions
+        self.num_states = len(states)
+        self.num_obs = len(observations)
+        self.num_actions = len(actions)
+
+        n_s, n_a = self.num_states, self.num_actions
+
+        self.obs = np.array(obs, dtype=np.intp)
+        self.goal = np.array(goal, dtype=bool)
+
+        self.legal = np.zeros((n_s, n_a), dtype=bool)
+        self.legal_ptr = np.zeros(n_s + 1, dtype=np.intp)
+        for s, acts in enumerate(legal_lists):
+            self.legal[s, acts] = True
+            self.legal_ptr[s + 1] = self.legal_ptr[s] + len(acts)
+        self.legal_act = np.array([a for acts in legal_lists for a in acts], dtype=np.intp)
+
+        self.trans_ptr = np.zeros(n_s * n_a + 1, dtype=np.intp)
+        for row in range(n_s * n_a):
+            self.trans_ptr[row + 1] = self.trans_ptr[row] + len(successors.get(row, ()))
+        self.trans_state = np.array([s_next for row in range(n_s * n_a)
+                                     for s_next, _ in successors.get(row, ())], dtype=np.intp)
+        self.trans_p = np.array([p for row in range(n_s * n_a)
+                                 for _, p in successors.get(row, ())], dtype=float)
+
+        # answers of the NoisyEnv interface
+        self._init_states_p = init_states_p
+        self._obs = self.obs.tolist()
+        self._goal = self.goal.tolist()
+        self._legal = legal_lists
+        self._successors = successors
+
+        super().__init__()
+
+    @property
+    def init_states_p(self):
+        return self._init_states_p
+
+    @property
+    def goal_states(self):
+        return np.flatnonzero(self.goal).tolist()
+
+    def is_goal_state(self, state):
+        return self._goal[state]
+
+    def legal_actions(self, state):
+        return self._legal[state]
+
+    def get_obs(self, state):
+        return self._obs[state]
+
+    def next_states_p(self, state, action):
+        return self._successors[state * self.num_actions + action]
+
+    def next_states_p_sorted(self, state, action):
+        # already sorted by compile_env
+        return self._successors[state * self.num_actions + action]
+
+    def str_state(self, s):
+        return self.env.str_state(self.states[s]) if type(s) is int else s
+
+    def str_action(self, a):
+        return self.env.str_action(self.actions[a]) if type(a) is int else a
+
+    def str_obs(self, o):
+        return self.env.str_obs(self.observations[o])
+
+
+def compile_env(env):
+    """ Enumerates the states of env reachable from its initial states
+
+    :type env: NoisyEnv
+    :rtype: TabularEnv
+    """
+    state_ids, states = {}, []
+    obs_ids, observations = {}, []
+    action_ids, actions = {}, []
+
+    def state_id(s):
+        if s not in state_ids:
+            state_ids[s] = len(states)
+            states.append(s)
+            queue.append(s)
+        return state_ids[s]
+
+    def get_id(ids, values, x):
+        if x not in ids:
+            ids[x] = len(values)
+            values.append(x)
+        return ids[x]
+
+    queue = deque()
+    init_states_p = [(state_id(s), p) for s, p in env.init_states_p]
+
+    obs, goal, legal_lists = [], [], []
+    # (state id, action id) -> successors, action ids are not known up front
+    successors = {}
+    while queue:
+        s = queue.popleft()
+        obs.append(get_id(obs_ids, observations, env.get_obs(s)))
+        goal.append(env.is_goal_state(s))
+
+        acts = []
+        for a in env.legal_actions(s):
+            a_id = get_id(action_ids, actions, a)
+            acts.append(a_id)
+            successors[state_ids[s], a_id] = [(state_id(s_next), p)
+                                              for s_next, p in env.next_states_p_sorted(s, a)]
+        legal_lists.append(acts)
+
+    n_a = len(actions)
+    successors = {s * n_a + a: sl for (s, a), sl in successors.items()}
+
+    return TabularEnv(env, states, observations, actions, init_states_p,
+                      obs, goal, legal_lists, successors)
@@ -0,0 +1,117 @@
+"""
+Structured trace of the search of PAndOrPlanner
+
+The planner only traces when a SearchTrace is active: one is given as
+PAndOrPlanner.trace, or logging is enabled at level INFO when the search
+starts. Otherwise every tracing site of the search is skipped by a single
+`is not None` test, with no formatting and no logger calls. Likewise, an
+event whose logging level is disabled (e.g. the DEBUG ones at level INFO)
+is neither converted nor formatted, unless it goes to a file.
+
+Each event is a dict with its kind ('event'), the depth of its node (the
+length of the history above it) and its fields. Written as JSON lines, the
+events can be read back with read_trace() and assembled into the tree of
+the choices of the search with search_tree().
+"""
+
+import json
+import logging
+from collections import Counter
+
+# event -> (logging level, message)
+EVENTS = {
+    'or': (logging.DEBUG, "AND: Simulating s: {s}, q: {q}"),
+    'goal': (logging.INFO, "OR: terminated in goal state"),
+    'not_goal': (logging.INFO, "OR: terminated in NOT goal state"),
+    'noter': (logging.INFO, "OR: repeated state"),
+    'loop': (logging.INFO, "OR: loop to level {level} with prob {p:.1f}"),
+    'nogood': (logging.INFO, "OR: nogood for q: {q}, s: {s}"),
+    'cut': (logging.INFO, "OR: cut off q: {q}, s: {s}"),
+    'illegal': (logging.INFO, "OR: illegal action {action} in state {s}"),
+    'transposition': (logging.INFO, "OR: transposition of q: {q}, s: {s}"),
+    'add': (logging.INFO, "OR: Added:   ({q},{obs}) -> ({q_next},{action})"),
+    'exhausted': (logging.INFO, "OR: all extensions failed"),
+    'and_success': (logging.INFO, "AND: succeed at depth {depth}, LGT in [{win}, {upper}]"),
+    'and_fail': (logging.INFO, "AND: fail at depth {depth}, LGT in [{win}, {upper}]"),
+    'and_continue': (logging.DEBUG, "AND: continue at depth {depth}, LGT in [{win}, {upper}]"),
+}
+
+
+class SearchTrace:
+    """ Writes the events of a search to a file as JSON lines, and/or to logging """
+
+    def __init__(self, env, path=None, log=False):
+        """
+        :param path: file that the events are written to, None for none
+        :param log: also send the events to logging, at the levels of EVENTS
+            (those enabled when the SearchTrace is made)
+        """
+        self.env = env
+        self.file = open(path, 'w') if path is not None else None
+        self.log = log
+        # the events sent to logging, so that the others are not formatted at all
+        logger = logging.getLogger()
+        self.logged = frozenset(event for event, (level, _) in EVENTS.items()
+                                if log and logger.isEnabledFor(level))
+        # field -> method of env that makes it readable
+        self._str = {'s': env.str_state, 'obs': env.str_obs, 'action': env.str_action}
+
+    def emit(self, event, depth, **fields):
+        logged = event in self.logged
+        if self.file is None and not logged:
+            return
+        for name, value in fields.items():
+            if name in self._str:
+                fields[name] = self._str[name](value)
+        if self.file is not None:
+            self.file.write(json.dumps({'event': event, 'depth': depth, **fields}, default=str) + '\n')
+        if logged:
+            level, message = EVENTS[event]
+            logging.log(level, message.format(depth=depth, **fields))
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def read_trace(path):
+    """ The events written to path by a SearchTrace """
+    with open(path) as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def search_tree(events):
+    """ The tree of the choices of a search, rebuilt from its events
+
+    A node is a branching OR node: a dict with 'q', 's', 'depth' and
+    'candidates', one dict per (q_next, action) tried with 'q_next',
+    'action', the nodes that branched while it was the current choice
+    ('children') and the number of events of each kind that occurred
+    meanwhile ('events'). A node tries its first candidate right after its
+    'or' event; as the search backtracks chronologically, any other
+    candidate is one of the innermost node not exhausted yet.
+
+    :returns: a dict with the 'children' and 'events' that occurred before the first choice
+    """
+    root = {'children': [], 'events': Counter()}
+    # the nodes not exhausted yet, innermost last
+    stack = []
+    current, previous = root, None
+    for event in events:
+        kind = event['event']
+        if kind == 'add':
+            if previous['event'] == 'or':
+                node = {'q': previous['q'], 's': previous['s'], 'depth': previous['depth'], 'candidates': []}
+                current['children'].append(node)
+                stack.append(node)
+            current = {'q_next': event['q_next'], 'action': event['action'], 'children': [], 'events': Counter()}
+            stack[-1]['candidates'].append(current)
+        elif kind == 'exhausted':
+            stack.pop()
+            current = stack[-1]['candidates'][-1] if stack else root
+        else:
+            current['events'][kind] += 1
+        previous = event
+    return root
@@ -0,0 +1,46 @@
+
+class Trail:
+    """ Undo trail for the in-place variant of the AND-OR search
+
+    Every write to an Alpha and every new controller transition is
+    recorded together with the value it overwrote, so that the search can
+    backtrack by undoing the writes instead of deep-copying the controller
+    and alpha at every OR branch.
+    """
+
+    _ALPHA = 0
+    _TRANSITION = 1
+
+    def __init__(self):
+        self.entries = []
+
+    def mark(self):
+        """ Returns a position on the trail that can be passed to undo() """
+        return len(self.entries)
+
+    def assign(self, alpha, index, value):
+        """ alpha.data[index] = value, remembering the old value
+
+        index is a flat index into an Alpha, or an integer array of them:
+        these stay valid when the Alpha grows. (Not a slice, whose view would
+        not keep the old values.)
+        """
+        old = alpha.data[index]
+        self.entries.append((self._ALPHA, alpha, index, old))
+        alpha.set(index, value)
+
+    def set_transition(self, c, key, value):
+        """ c[key] = value for a transition that is not yet defined in c """
+        assert key not in c.transitions
+        c[key] = value
+        self.entries.append((self._TRANSITION, c, key, None))
+
+    def undo(self, mark):
+        """ Reverts all writes made since mark, most recent first """
+        entries = self.entries
+        while len(entries) > mark:
+            kind, obj, index, old = entries.pop()
+            if kind is self._ALPHA:
+                obj.set(index, old)
+            else:
+                del obj[index]
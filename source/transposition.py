@@ -0,0 +1,135 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from controller import A_STOP
+from evaluate import absorption_likelihoods
+
+
+class TranspositionTable:
+    """ Likelihoods of the subtrees of the search that the controller already determines
+
+    From an OR node (q, s), the runs only visit the (q', s') pairs reachable
+    in the Markov chain of the controller. If the controller defines the
+    transition of each of them, the fragment is closed: the subtree below
+    (q, s) adds no transitions, and its runs end in 'win', 'fail' or never
+    with likelihoods that only depend on the transitions N of the fragment,
+    not on the history or on the branch of the search that reached (q, s).
+    The table computes them with a linear solve (see
+    evaluate.absorption_likelihoods) and keeps (q, s, N) -> likelihoods, so
+    that the search can account for the node at once instead of simulating
+    its subtree, in every branch whose controller contains N.
+
+    Open fragments are kept too, keyed by the transitions visited until the
+    first undefined one (with value None), so that they are not traversed
+    again while that entry is still undefined.
+    """
+
+    def __init__(self, env, capacity=10000, max_fragment=10000):
+        self.env = env
+        self.capacity = capacity
+        # fragments with more (q, s) pairs are treated as open, and not kept
+        self.max_fragment = max_fragment
+        # (q, s, N) -> (win, fail, noter), or None for an open fragment, least recently used first
+        self._entries = OrderedDict()
+        # (q, s) -> set of N
+        self._by_node = {}
+
+        # counters for stats
+        self.lookups = 0
+        self.hits = 0
+        self.solved = 0
+        self.open = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, c, q, s):
+        """ The transitions N and the likelihoods (win, fail, noter) of the subtree of (q, s)
+        in c, or None if its fragment is open """
+        self.lookups += 1
+        transitions = c.transitions
+
+        for used in self._by_node.get((q, s), ()):
+            if all(transitions.get(key) == value for key, value in used):
+                entry = (q, s, used)
+                self._entries.move_to_end(entry)
+                likelihoods = self._entries[entry]
+                if likelihoods is None:
+                    self.open += 1
+                    return None
+                self.hits += 1
+                return used, likelihoods
+
+        fragment = self._fragment(c, q, s)
+        if fragment is None:
+            self.open += 1
+            return None
+        used, chain = fragment
+        if chain is None:
+            self.open += 1
+            likelihoods = None
+        else:
+            self.solved += 1
+            src, dst, p, win, fail = chain
+            win_0, fail_0 = absorption_likelihoods(np.array(src, dtype=np.intp), np.array(dst, dtype=np.intp),
+                                                   np.array(p), np.array(win), np.array(fail))[0]
+            likelihoods = float(win_0), float(fail_0), max(0., 1. - win_0 - fail_0)
+        self._store((q, s, used), likelihoods)
+        return None if likelihoods is None else (used, likelihoods)
+
+    def _fragment(self, c, q, s):
+        """ The transitions used from (q, s), and the Markov chain on the reachable (q', s')
+        pairs if they are all defined (None otherwise); None if the fragment is too large """
+        env = self.env
+        transitions = c.transitions
+        ids = {(q, s): 0}
+        nodes = [(q, s)]
+        used = {}
+        src, dst, p = [], [], []
+        win, fail = [], []
+
+        i = 0
+        while i < len(nodes):
+            q_i, s_i = nodes[i]
+            key = q_i, env.get_obs(s_i)
+            value = used[key] = transitions.get(key)
+            if value is None:
+                return frozenset(used.items()), None
+
+            q_next, action = value
+            win.append(action is A_STOP and env.is_goal_state(s_i))
+            fail.append(not win[-1] and (action is A_STOP or action not in env.legal_actions(s_i)))
+            if not (win[-1] or fail[-1]):
+                for s_next, p_next in env.next_states_p(s_i, action):
+                    node = q_next, s_next
+                    if node not in ids:
+                        if len(nodes) == self.max_fragment:
+                            return None
+                        ids[node] = len(nodes)
+                        nodes.append(node)
+                    src.append(i)
+                    dst.append(ids[node])
+                    p.append(p_next)
+            i += 1
+
+        return frozenset(used.items()), (src, dst, p, win, fail)
+
+    def _store(self, entry, likelihoods):
+        q, s, used = entry
+        self._entries[entry] = likelihoods
+        self._by_node.setdefault((q, s), set()).add(used)
+
+        while len(self._entries) > self.capacity:
+            (q_old, s_old, used_old), _ = self._entries.popitem(last=False)
+            node = self._by_node[q_old, s_old]
+            node.discard(used_old)
+            if not node:
+                del self._by_node[q_old, s_old]
+            self.evictions += 1
+
+    def stats(self):
+        return {'entries': len(self._entries), 'lookups': self.lookups, 'hits': self.hits,
+                'hit_rate': self.hits / self.lookups if self.lookups else 0.,
+                'solved': self.solved, 'open': self.open, 'evictions': self.evictions}